@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Cache vykreslenych grafov spolocna pre get_stat.py (proj1), analysis.py (proj2) a geo.py (proj3)
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import inspect
+import numpy as np
+import matplotlib
+
+
+class FigureCache:
+    """Cache vykreslenych grafov adresovana obsahom
+
+    Kluc grafu je SHA-256 z mena a zdrojoveho kodu funkcie, verzie matplotlib,
+    zavislosti (zdrojovy kod pomocnych funkcii, verzie kniznic), parametrov
+    (napr. pripona suboru) a dat, z ktorych sa graf kresli. Pri zhode sa subor
+    z cache skopiruje na fig_location a matplotlib sa nevola. Subor sa kopiruje,
+    nie linkuje, aby neskorsie savefig do fig_location neprepisal subor v cache.
+
+    Po kazdom ulozeni grafu sa z jeho zlozky cache zmazu grafy starsie ako
+    max_age a potom najdlhsie nepouzite grafy, kym zlozka nie je mensia ako
+    max_bytes. Zasah obnovi cas poslednej zmeny suboru v cache.
+
+    Attributes:
+    directory -- zlozka cache (default "None") - zlozka .figure_cache vedla fig_location
+    enabled -- ak False, grafy sa vzdy vykresluju
+    max_bytes -- najvacsia velkost zlozky cache v bajtoch, None bez obmedzenia (default 256 MB)
+    max_age -- najvacsi vek nepouziteho grafu v sekundach, None bez obmedzenia (default 30 dni)
+    hits, misses -- pocet grafov skopirovanych z cache a vykreslenych
+    evicted -- pocet grafov zmazanych z cache
+    """
+
+    def __init__(self, directory: str = None, enabled: bool = True, max_bytes: int = 256 << 20,
+                 max_age: float = 30 * 24 * 3600):
+        self.directory = directory
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.reset()
+
+    @staticmethod
+    def _source(function) -> str:
+        """Zdrojovy kod funkcie (alebo jej bajtkod, ak zdrojovy kod nie je dostupny)"""
+        try:
+            return inspect.getsource(function)
+        except (OSError, TypeError):
+            return function.__code__.co_code.hex()
+
+    def key(self, function, inputs: list, params: dict = None, dependencies: list = ()) -> str:
+        """Vrati kluc grafu funkcie pre vstupne data a parametre
+
+        Arguments:
+        function -- funkcia, ktora graf vykresluje
+        inputs -- zoznam dat grafu (numpy polia, DataFrame alebo hodnoty s repr)
+
+        Keyword arguments:
+        params -- slovnik parametrov grafu serializovatelny do JSON (default "None")
+        dependencies -- pomocne funkcie (do kluca ide ich zdrojovy kod) a retazce
+                        (napr. verzie kniznic), od ktorych graf zavisi (default ())
+        """
+        digest = hashlib.sha256()
+        parts = [function.__qualname__, self._source(function), matplotlib.__version__,
+                 json.dumps(params or {}, sort_keys=True)]
+        parts += [value if isinstance(value, str) else self._source(value) for value in dependencies]
+        for part in parts:
+            digest.update(part.encode() + b"\0")
+        for value in inputs:
+            if isinstance(value, np.ndarray) or hasattr(value, "to_numpy"):
+                value = np.ascontiguousarray(value)
+                digest.update(f"{value.dtype}{value.shape}".encode())
+                # pole objektov sa hashuje cez hodnoty, nie cez adresy objektov
+                digest.update(repr(value.tolist()).encode() if value.dtype.kind == "O" else value.tobytes())
+            else:
+                digest.update(repr(value).encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def path(self, key: str, fig_location: str) -> str:
+        """Cesta k suboru grafu v cache"""
+        directory = self.directory or os.path.join(os.path.dirname(os.path.abspath(fig_location)), ".figure_cache")
+        return os.path.join(directory, key + os.path.splitext(fig_location)[1])
+
+    def fetch(self, key: str, fig_location: str) -> bool:
+        """Skopiruje graf z cache na fig_location, vrati False ak v cache nie je"""
+        cached = self.path(key, fig_location)
+        tmp = f"{fig_location}.{os.getpid()}.tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(fig_location)), exist_ok=True)
+        try:
+            shutil.copyfile(cached, tmp)
+            # pouzity graf sa pri upratovani zmaze ako posledny
+            os.utime(cached)
+        except FileNotFoundError:
+            # graf v cache nie je (alebo ho prave zmazal iny proces)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            self.misses += 1
+            return False
+        os.replace(tmp, fig_location)
+        self.hits += 1
+        return True
+
+    def store(self, key: str, fig_location: str):
+        """Ulozi vykresleny graf z fig_location do cache a upraci zlozku cache"""
+        cached = self.path(key, fig_location)
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        tmp = f"{cached}.{os.getpid()}.tmp"
+        shutil.copyfile(fig_location, tmp)
+        os.replace(tmp, cached)
+        self.evict(os.path.dirname(cached), keep=cached)
+
+    def evict(self, directory: str, keep: str = None):
+        """Zmaze zo zlozky cache grafy starsie ako max_age a najdlhsie nepouzite grafy nad max_bytes
+
+        Keyword arguments:
+        keep -- cesta grafu, ktory sa nezmaze (prave ulozeny graf) (default "None")
+        """
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".tmp") or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        # od najdlhsie nepouziteho grafu
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        for mtime, size, path in entries:
+            expired = self.max_age is not None and now - mtime > self.max_age
+            if not expired and (self.max_bytes is None or total <= self.max_bytes):
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                self.evicted += 1
+            except FileNotFoundError:
+                # subor zmazal iny proces
+                pass
+            total -= size
+
+    def stats(self) -> dict:
+        """Pocet zasahov, vykresleni a zmazanych grafov a podiel zasahov"""
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evicted": self.evicted,
+                "hit_rate": self.hits / total if total else 0.0}
+
+    def reset(self):
+        """Vynuluje pocitadla statistik"""
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Projekt 1 do predmetu IZV
+# Autor: xhorni20@fit.vut.cz (Matej Hornik)
+
+import numpy as np
+import os
+import shutil
+import tempfile
+import matplotlib
+from argparse import ArgumentParser
+from time import perf_counter
+from download import DataDownloader
+from synth_data import generate_data
+
+# grafy sa len ukladaju, nie zobrazuju
+matplotlib.use("Agg")
+import get_stat
+
+# meria sa vykreslenie, nie kopirovanie grafu z cache
+if get_stat.figure_cache is not None:
+    get_stat.figure_cache.enabled = False
+
+
+def fake_region(region, rows, rng):
+    """Vytvori nahodne data jedneho regionu v tvare ako vracia parse_region_data
+
+    Arguments:
+        region -- skratka regionu
+        rows -- pocet riadkov
+        rng -- numpy generator nahodnych cisel
+    """
+    data = {}
+    for header, data_type in zip(DataDownloader.headers, DataDownloader.data_types):
+        if "U" in data_type:
+            data[header] = rng.choice(["", "abc", "Ulice", "12345"], rows).astype(data_type)
+        elif "M" in data_type:
+            data[header] = np.datetime64("2016-01-01") + rng.integers(0, 5 * 365, rows)
+        elif "f" in data_type:
+            data[header] = rng.random(rows) * 1e6
+        else:
+            data[header] = rng.integers(-1, 100, rows).astype(data_type)
+    data["region"] = np.full(rows, region, dtype="U3")
+    return data
+
+
+def bench_stacking(years, rows_per_year=10000, repeat=3):
+    """Zmeria cas spojenia vsetkych regionov v get_dict pre rozny pocet rokov dat
+
+    Regiony su uz v cache pamati, meria sa len spajanie poli. Pri linearnom
+    spajani je cas na riadok priblizne konstantny.
+
+    Arguments:
+        years -- zoznam poctov rokov dat
+    Keyword arguments:
+        rows_per_year -- pocet riadkov jedneho regionu za rok (default 10000)
+        repeat -- pocet opakovani merania, vypise sa najlepsi cas (default 3)
+    """
+    rng = np.random.default_rng(0)
+    print(f"{'roky':>5} {'riadky':>10} {'cas [s]':>9} {'ns/riadok':>10}")
+    for year_count in years:
+        downloader = DataDownloader()
+        downloader.region_cache.clear()
+        for region in downloader.regions:
+            downloader._remember(region, fake_region(region, rows_per_year * year_count, rng))
+
+        best = float("inf")
+        for _ in range(repeat):
+            start = perf_counter()
+            data = downloader.get_dict()
+            best = min(best, perf_counter() - start)
+        rows = data["region"].size
+        print(f"{year_count:>5} {rows:>10} {best:>9.3f} {best / rows * 1e9:>10.1f}")
+
+
+def _timed(function, *args, **kwargs):
+    """Zavola funkciu a vrati (vysledok, cas v sekundach)"""
+    start = perf_counter()
+    result = function(*args, **kwargs)
+    return result, perf_counter() - start
+
+
+def bench_ingest(sizes, folder=None, cache_format="pickle", region="PHA"):
+    """Zmeria spracovanie synteticky vytvorenych zip suborov pre rozne pocty riadkov
+
+    Pre kazdu velkost sa vytvoria zip subory (synth_data.generate_data) a zmeria sa
+    parse_region_data jedneho regionu, prve get_dict vsetkych regionov (spracovanie
+    zip suborov a zapis cache), get_dict z cache suborov, get_dict z cache pamate
+    a vykreslenie grafu get_stat.plot_stat. Cas generovania dat sa nemeria.
+
+    Arguments:
+        sizes -- zoznam celkovych poctov riadkov
+    Keyword arguments:
+        folder -- zlozka pre vytvorene data, pre kazdu velkost sa pouzije podzlozka
+                  a data sa ponechaju (default "None") - docasna zlozka, po merani sa zmaze
+        cache_format -- format cache suborov DataDownloader (default "pickle")
+        region -- region pre meranie parse_region_data (default "PHA")
+    """
+    print(f"{'riadky':>10} {'parse ' + region:>10} {'studeny':>9} {'subory':>9} {'pamat':>9} "
+          f"{'plot_stat':>10} {'us/riadok':>10}")
+    for rows in sizes:
+        data_folder = os.path.join(folder, str(rows)) if folder else tempfile.mkdtemp(prefix="izv_bench_")
+        try:
+            generate_data(data_folder, rows)
+            downloader = DataDownloader(folder=data_folder, cache_format=cache_format)
+            downloader.region_cache.clear()
+            _, parse_time = _timed(downloader.parse_region_data, region)
+            # studene get_dict spracuje zip subory, dalsie nacitaju cache subory a cache pamat
+            _, cold_time = _timed(downloader.get_dict)
+            downloader.region_cache.clear()
+            _, disk_time = _timed(downloader.get_dict)
+            data, memory_time = _timed(downloader.get_dict)
+            _, plot_time = _timed(get_stat.plot_stat, data, os.path.join(data_folder, "stat.png"))
+            parsed_rows = data["region"].size
+            print(f"{parsed_rows:>10} {parse_time:>10.3f} {cold_time:>9.3f} {disk_time:>9.3f} {memory_time:>9.3f} "
+                  f"{plot_time:>10.3f} {cold_time / parsed_rows * 1e6:>10.1f}")
+        finally:
+            DataDownloader.region_cache.clear()
+            if not folder:
+                shutil.rmtree(data_folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    # spracovanie argumentov pomocou ArgumentParser()
+    parser = ArgumentParser()
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="Pocty rokov dat, pre ktore sa zmeria spajanie regionov")
+    parser.add_argument("--rows_per_year", type=int, default=10000,
+                        help="Pocet riadkov jedneho regionu za rok")
+    parser.add_argument("--suite", choices=["stacking", "ingest", "all"], default="all",
+                        help="Meranie spajania regionov, spracovania syntetickych zip suborov alebo oboje")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000],
+                        help="Celkove pocty riadkov syntetickych dat pre meranie spracovania")
+    parser.add_argument("--folder",
+                        help="Ak zadane, synteticke data sa vytvoria a ponechaju v tejto zlozke")
+    parser.add_argument("--cache_format", choices=DataDownloader.cache_formats, default="pickle",
+                        help="Format cache suborov pri merani spracovania")
+    args = parser.parse_args()
+
+    if args.suite in ("stacking", "all"):
+        bench_stacking(args.years, args.rows_per_year)
+    if args.suite in ("ingest", "all"):
+        bench_ingest(args.rows, args.folder, args.cache_format)
@@ -12,15 +12,498 @@ import sys
 from bs4 import BeautifulSoup
 from zipfile import ZipFile
 import csv
-from io import TextIOWrapper
+from io import TextIOWrapper, BufferedIOBase
 import pickle
 import gzip
-from time import time
+from time import time, perf_counter
+from itertools import islice, zip_longest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from threading import Lock, local
+import re
+import json
+import hashlib
+import tracemalloc
+from collections import OrderedDict
+from argparse import ArgumentParser
+from contextlib import contextmanager, ExitStack
+try:
+    import fcntl
+except ImportError:
+    # Windows, cache subory sa nezamykaju
+    fcntl = None
 
 # Kromě vestavěných knihoven (os, sys, re, requests …) byste si měli vystačit s: gzip, pickle, csv, zipfile, numpy, matplotlib, BeautifulSoup.
 # Další knihovny je možné použít po schválení opravujícím (např ve fóru WIS).
 
 
+class EncodedColumn:
+    """Stlpec retazcov ulozeny ako celociselne kody a slovnik (vocabulary) roznych hodnot
+
+    Namiesto retazca pevnej dlzky (napr. U32 = 128 B) sa pre kazdu bunku uklada len
+    maly celociselny kod, retazce sa ulozia len raz vo vocabulary. Hodnoty sa
+    dekoduju az na poziadanie cez decode(), np.asarray() alebo to_categorical().
+
+    Attributes:
+        codes -- numpy pole kodov, codes[i] je index hodnoty vo vocabulary
+        vocabulary -- zoradene numpy pole roznych hodnot stlpca
+    """
+
+    def __init__(self, codes, vocabulary):
+        self.codes = codes
+        self.vocabulary = vocabulary
+
+    @classmethod
+    def encode(cls, values):
+        """Zakoduje numpy pole retazcov, kody maju najmensi postacujuci celociselny typ"""
+        vocabulary, codes = np.unique(values, return_inverse=True)
+        return cls(codes.astype(np.min_scalar_type(-max(vocabulary.size, 1))), vocabulary)
+
+    @classmethod
+    def concatenate(cls, parts):
+        """Spoji zakodovane stlpce (alebo polia retazcov) do jedneho so spolocnym slovnikom"""
+        parts = [part if isinstance(part, cls) else cls.encode(np.asarray(part)) for part in parts]
+        vocabulary = np.unique(np.concatenate([part.vocabulary for part in parts]))
+        codes = np.empty(sum(len(part) for part in parts), dtype=np.min_scalar_type(-max(vocabulary.size, 1)))
+        # kody kazdej casti premapujem na index v spolocnom slovniku
+        offset = 0
+        for part in parts:
+            codes[offset:offset + len(part)] = np.searchsorted(vocabulary, part.vocabulary)[part.codes]
+            offset += len(part)
+        return cls(codes, vocabulary)
+
+    def decode(self):
+        """Vrati dekodovane numpy pole retazcov"""
+        return self.vocabulary[self.codes]
+
+    def to_categorical(self):
+        """Vrati stlpec ako pandas.Categorical bez dekodovania retazcov"""
+        import pandas as pd
+        return pd.Categorical.from_codes(self.codes, categories=self.vocabulary)
+
+    @property
+    def dtype(self):
+        """Datovy typ dekodovanych hodnot"""
+        return self.vocabulary.dtype
+
+    @property
+    def size(self):
+        return self.codes.size
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.vocabulary.nbytes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, key):
+        # jeden prvok vrati hodnotu, rez alebo maska vrati zakodovany stlpec s rovnakym slovnikom
+        if isinstance(key, (int, np.integer)):
+            return self.vocabulary[self.codes[key]]
+        return EncodedColumn(self.codes[key], self.vocabulary)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.decode()
+        return values if dtype is None else values.astype(dtype)
+
+    def __repr__(self):
+        return f"EncodedColumn(size={self.size}, vocabulary={self.vocabulary.size}, dtype={self.dtype})"
+
+
+class RegionCache:
+    """Cache pamat spracovanych regionov zdielana vsetkymi instanciami DataDownloader v procese
+
+    Regiony sa uchovavaju v poradi posledneho pouzitia (LRU). Ak by velkost dat
+    presiahla max_bytes, najdlhsie nepouzite regiony sa z pamate vyhodia a pri
+    dalsom pouziti sa nacitaju znova z cache suboru. Do velkosti sa nezapocitavaju
+    polia namapovane zo suboru (cache "npy"), tie drzi v pamati operacny system.
+    Kazdy region ma ulozenu aj znacku cache suboru, z ktoreho pochadza. Ak sa pri
+    get znacka lisi (subor prepisal iny proces), region sa z pamate vyhodi.
+
+    Attributes:
+        max_bytes -- maximalna velkost dat v bajtoch, None znamena bez obmedzenia
+        hits -- pocet najdenych regionov
+        misses -- pocet nenajdenych regionov (vratane zastaranych)
+        evictions -- pocet vyhodenych regionov
+        stale -- pocet regionov vyhodenych pre zmeneny cache subor
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def data_nbytes(data):
+        """Vrati pocet bajtov dat regionu, ktore nie su namapovane zo suboru"""
+        def resident(values):
+            if isinstance(values, EncodedColumn):
+                return resident(values.codes) + resident(values.vocabulary)
+            return 0 if isinstance(values, np.memmap) else values.nbytes
+        return sum(resident(values) for values in data.values())
+
+    def get(self, key, stamp=None):
+        """Vrati data regionu alebo None, pouzity region sa presunie na koniec poradia
+
+        Keyword arguments:
+            stamp -- aktualna znacka cache suboru, region s inou znackou sa vyhodi (default "None")
+        """
+        with self._lock:
+            if key in self._entries and self._entries[key][2] != stamp:
+                self._discard(key)
+                self.stale += 1
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, data, stamp=None):
+        """Ulozi data regionu so znackou cache suboru, pri prekroceni max_bytes vyhodi najdlhsie nepouzite regiony"""
+        nbytes = self.data_nbytes(data)
+        with self._lock:
+            self._discard(key)
+            if self.max_bytes is not None and nbytes > self.max_bytes:
+                # region sa do pamate nezmesti vobec, zostane len v cache subore
+                return
+            self._entries[key] = (data, nbytes, stamp)
+            self.nbytes += nbytes
+            while self.max_bytes is not None and self.nbytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _discard(self, key):
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        """Vyhodi vsetky regiony z pamate"""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """Vrati slovnik so statistikami cache pamate"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "stale": self.stale,
+                    "regions": len(self._entries), "nbytes": self.nbytes, "max_bytes": self.max_bytes}
+
+
+class IngestStats:
+    """Statistiky jednotlivych faz spracovania dat: cas, bajty, riadky a spicka alokacie
+
+    Fazy ("network", "unzip", "decode", "convert", "dedup", "stack", "pickle",
+    "compress", "write", "load", "hash") sa mozu vnarat, kazdej faze sa zapocita
+    len cas bez vnorenych faz, takze sucet casov je celkovy cas spracovania.
+    Spicka alokacie sa meria cez tracemalloc len pri trace_memory=True (vyrazne
+    spomaluje) a je to najvacsi narast alokovanej pamate procesu pocas fazy.
+    Casy fazy "network" su scitane zo vsetkych stahovacich vlakien.
+
+    Attributes:
+        trace_memory -- merat spicku alokacie cez tracemalloc
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self._stages = {}
+        self._lock = Lock()
+        self._local = local()
+
+    def __getstate__(self):
+        # zamok a zasobnik vlakna sa do procesov neprenasaju
+        return {"trace_memory": self.trace_memory, "_stages": self._stages}
+
+    def __setstate__(self, state):
+        self.__init__(state["trace_memory"])
+        self._stages = state["_stages"]
+
+    @contextmanager
+    def stage(self, name, nbytes=0, rows=0):
+        """Zmeria fazu spracovania v bloku with
+
+        Arguments:
+            name -- meno fazy
+
+        Keyword arguments:
+            nbytes -- pocet spracovanych bajtov (default 0)
+            rows -- pocet spracovanych riadkov (default 0)
+
+        Yields:
+            slovnik {"bytes", "rows"}, v ktorom sa daju pocty doplnit az pocas fazy
+        """
+        frames = self._local.__dict__.setdefault("frames", [])
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracing = self.trace_memory
+        frame = {"children": 0.0, "peak": 0, "memory": 0}
+        if tracing:
+            frame["memory"], peak = tracemalloc.get_traced_memory()
+            if frames:
+                # spicku nadradenej fazy si zapamatam pred vynulovanim
+                frames[-1]["peak"] = max(frames[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+        counts = {"bytes": nbytes, "rows": rows}
+        frames.append(frame)
+        start = perf_counter()
+        try:
+            yield counts
+        finally:
+            elapsed = perf_counter() - start
+            frames.pop()
+            peak = None
+            if tracing:
+                peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+                if frames:
+                    frames[-1]["peak"] = max(frames[-1]["peak"], peak)
+                peak -= frame["memory"]
+            if frames:
+                frames[-1]["children"] += elapsed
+            self.add(name, elapsed - frame["children"], counts["bytes"], counts["rows"], peak)
+
+    def add(self, name, seconds, nbytes=0, rows=0, peak=None, calls=1):
+        """Pripocita k fazi cas, bajty, riadky, volania a pripadne spicku alokacie"""
+        with self._lock:
+            entry = self._stages.setdefault(name, {"time": 0.0, "bytes": 0, "rows": 0, "calls": 0, "peak": None})
+            entry["time"] += seconds
+            entry["bytes"] += nbytes
+            entry["rows"] += rows
+            entry["calls"] += calls
+            if peak is not None:
+                entry["peak"] = max(entry["peak"] or 0, peak)
+
+    def merge(self, stages):
+        """Pripocita statistiky fazy z ineho procesu (vysledok stats())"""
+        for name, entry in stages.items():
+            with self._lock:
+                own = self._stages.setdefault(name, {"time": 0.0, "bytes": 0, "rows": 0, "calls": 0, "peak": None})
+                for key in ("time", "bytes", "rows", "calls"):
+                    own[key] += entry[key]
+                if entry["peak"] is not None:
+                    own["peak"] = max(own["peak"] or 0, entry["peak"])
+
+    def reset(self):
+        """Vymaze vsetky namerane statistiky"""
+        with self._lock:
+            self._stages.clear()
+
+    def stats(self):
+        """Vrati slovnik faza: {"time", "bytes", "rows", "calls", "peak"}, peak je None bez trace_memory"""
+        with self._lock:
+            return {name: dict(entry) for name, entry in self._stages.items()}
+
+    def summary(self):
+        """Vrati textovu tabulku statistik fazy zoradenu podla casu"""
+        stages = sorted(self.stats().items(), key=lambda item: item[1]["time"], reverse=True)
+        total = sum(entry["time"] for _, entry in stages)
+        lines = [f"{'faza':<10} {'cas [s]':>9} {'%':>6} {'MB':>10} {'riadky':>11} {'volania':>8} {'spicka MB':>10}"]
+        for name, entry in stages:
+            peak = f"{entry['peak'] / 2**20:>10.1f}" if entry["peak"] is not None else f"{'-':>10}"
+            lines.append(f"{name:<10} {entry['time']:>9.3f} {entry['time'] / total * 100 if total else 0:>6.1f} "
+                         f"{entry['bytes'] / 2**20:>10.1f} {entry['rows']:>11} {entry['calls']:>8} {peak}")
+        lines.append(f"{'spolu':<10} {total:>9.3f}")
+        return "\n".join(lines)
+
+
+class _TimedReader(BufferedIOBase):
+    """Obal binarneho suboru, citanie sa zapocita do fazy statistik (napr. rozbalovanie zip suboru)
+
+    Attributes:
+        total -- pocet doteraz precitanych bajtov
+    """
+
+    def __init__(self, raw, stats, name):
+        self.raw = raw
+        self.stats = stats
+        self.name = name
+        self.total = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        with self.stats.stage(self.name) as counts:
+            data = self.raw.read(size)
+            counts["bytes"] = len(data)
+        self.total += len(data)
+        return data
+
+    def read1(self, size=-1):
+        with self.stats.stage(self.name) as counts:
+            data = self.raw.read1(size)
+            counts["bytes"] = len(data)
+        self.total += len(data)
+        return data
+
+
+def _encode_key(values, labels=None):
+    """Zakoduje hodnoty kluca na cele cisla 0..k-1 pre crosstab
+
+    Arguments:
+        values -- numpy pole alebo EncodedColumn
+
+    Keyword arguments:
+        labels -- zoznam hodnot kluca v pozadovanom poradi, ostatne hodnoty dostanu
+                  kod -1 (default "None") - vsetky hodnoty vyskytujuce sa v datach
+
+    Returns:
+        (codes, labels) -- kody hodnot a numpy pole hodnot kluca
+    """
+    if labels is not None:
+        labels = np.asarray(labels)
+        if isinstance(values, EncodedColumn):
+            # zakodovany stlpec premapujem cez slovnik, nie cez kazdu bunku
+            codes, _ = _encode_key(values.vocabulary, labels)
+            return codes[values.codes], labels
+        values = np.asarray(values)
+        order = np.argsort(labels, kind="stable")
+        positions = np.clip(np.searchsorted(labels[order], values), 0, max(labels.size - 1, 0))
+        found = labels[order][positions] == values if labels.size else np.zeros(values.shape, dtype=bool)
+        return np.where(found, order[positions] if labels.size else 0, -1), labels
+
+    if isinstance(values, EncodedColumn):
+        return values.codes.astype(np.intp), values.vocabulary
+    values = np.asarray(values)
+    if values.dtype.kind in "iu" and values.size:
+        # male celociselne kody posuniem o minimum, bez triedenia
+        low, high = int(values.min()), int(values.max())
+        if high - low <= max(values.size, 1 << 16):
+            return values.astype(np.intp) - low, np.arange(low, high + 1).astype(values.dtype)
+    if values.dtype.kind == "U" and values.size:
+        # kratke retazce (napr. skratky regionov) zlozim zo znakov do cisla, poradie cisel
+        # je lexikograficke poradie retazcov, kody urci tabulka vyskytujucich sa cisel
+        chars = np.ascontiguousarray(values).view(np.uint32).reshape(values.size, -1)
+        bits = max(int(chars.max()).bit_length(), 1)
+        if bits * chars.shape[1] <= 24:
+            keys = np.zeros(values.size, dtype=np.intp)
+            for i in range(chars.shape[1]):
+                keys = (keys << bits) | chars[:, i]
+            present = np.flatnonzero(np.bincount(keys))
+            lookup = np.zeros(present[-1] + 1, dtype=np.intp)
+            lookup[present] = np.arange(present.size)
+            shifts = bits * np.arange(chars.shape[1] - 1, -1, -1)
+            labels = ((present[:, None] >> shifts) & ((1 << bits) - 1)).astype(np.uint32)
+            return lookup[keys], np.ascontiguousarray(labels).view(values.dtype).reshape(-1)
+    labels, codes = np.unique(values, return_inverse=True)
+    return codes.reshape(-1), labels
+
+
+def crosstab(data, row_key="region", col_key="p24", row_labels=None, col_labels=None):
+    """Spocita pocty riadkov pre vsetky dvojice hodnot dvoch stlpcov jednym prechodom np.bincount
+
+    Oba kluce sa zakoduju na cele cisla (celociselne stlpce posunom o minimum,
+    EncodedColumn cez jeho kody, zadane hodnoty cez searchsorted, ostatne cez
+    np.unique) a cela matica poctov vznikne z jedneho np.bincount.
+
+    Arguments:
+        data -- slovnik numpy poli (napr. vysledok get_dict)
+
+    Keyword arguments:
+        row_key -- stlpec urcujuci riadky matice (default "region")
+        col_key -- stlpec urcujuci stlpce matice (default "p24")
+        row_labels -- hodnoty riadkov v pozadovanom poradi, riadky dat s inou hodnotou
+                      sa nezapocitaju (default "None") - hodnoty vyskytujuce sa v datach
+        col_labels -- hodnoty stlpcov v pozadovanom poradi (default "None") - hodnoty vyskytujuce sa v datach
+
+    Returns:
+        (counts, row_labels, col_labels) -- matica poctov tvaru (len(row_labels), len(col_labels))
+        a hodnoty riadkov a stlpcov
+    """
+    row_codes, rows = _encode_key(data[row_key], row_labels)
+    col_codes, cols = _encode_key(data[col_key], col_labels)
+    # hodnoty doplnene rozsahom celociselneho kluca (alebo slovnikom), ktore sa v datach nevyskytuju, vynecham
+    row_present = np.bincount(row_codes, minlength=rows.size) > 0 if row_labels is None else None
+    col_present = np.bincount(col_codes, minlength=cols.size) > 0 if col_labels is None else None
+
+    valid = (row_codes >= 0) & (col_codes >= 0)
+    if not valid.all():
+        row_codes, col_codes = row_codes[valid], col_codes[valid]
+    counts = np.bincount(row_codes * cols.size + col_codes, minlength=rows.size * cols.size)
+    counts = counts.reshape(rows.size, cols.size)
+    if row_present is not None:
+        counts, rows = counts[row_present], rows[row_present]
+    if col_present is not None:
+        counts, cols = counts[:, col_present], cols[col_present]
+    return counts, rows, cols
+
+
+class CountCube:
+    """Kocka poctov nehod region x rok x mesiac x hodnota jedneho stlpca
+
+    Vytvara sa cez DataDownloader.count_cube z poctov ulozenych v manifestoch
+    regionov, data regionov sa pri tom necitaju. Nehody bez platneho datumu
+    maju rok aj mesiac -1.
+
+    Attributes:
+        column -- stlpec, ktoreho hodnoty tvoria os "value"
+        counts -- numpy pole poctov tvaru (regiony, roky, mesiace, hodnoty)
+        labels -- slovnik os: numpy pole hodnot osi, osi su v poradi dims
+    """
+
+    dims = ("region", "year", "month", "value")
+
+    def __init__(self, column, counts, labels):
+        self.column = column
+        self.counts = counts
+        self.labels = labels
+
+    @classmethod
+    def merge(cls, column, parts):
+        """Spoji kocky (napr. jednotlivych regionov) so zjednotenim hodnot vsetkych osi"""
+        labels = {dim: np.unique(np.concatenate([part.labels[dim] for part in parts])) for dim in cls.dims}
+        counts = np.zeros(tuple(labels[dim].size for dim in cls.dims), dtype=np.int64)
+        for part in parts:
+            index = np.ix_(*(np.searchsorted(labels[dim], part.labels[dim]) for dim in cls.dims))
+            counts[index] += part.counts
+        return cls(column, counts, labels)
+
+    def select(self, **labels):
+        """Vrati kocku obmedzenu na zadane hodnoty osi v zadanom poradi
+
+        Napr. select(region=["PHA", "STC"], year=[2020]). Hodnota, ktora v kocke
+        nie je, ma nulove pocty.
+        """
+        counts, result = self.counts, dict(self.labels)
+        for axis, dim in enumerate(self.dims):
+            if dim not in labels:
+                continue
+            codes, result[dim] = _encode_key(self.labels[dim], labels[dim])
+            # pre kazdu pozadovanu hodnotu index v kocke, chybajuce hodnoty ukazuju na pridany nulovy rez
+            positions = np.full(result[dim].size, counts.shape[axis])
+            positions[codes[codes >= 0]] = np.flatnonzero(codes >= 0)
+            zeros = np.zeros(counts.shape[:axis] + (1,) + counts.shape[axis + 1:], dtype=counts.dtype)
+            counts = np.take(np.concatenate([counts, zeros], axis=axis), positions, axis=axis)
+        return CountCube(self.column, counts, result)
+
+    def rollup(self, *dims):
+        """Scita kocku cez osi, ktore nie su v dims
+
+        Arguments:
+            dims -- osi vysledku v pozadovanom poradi, napr. rollup("region", "value")
+
+        Returns:
+            (counts, labels) -- numpy pole poctov s osami v poradi dims a zoznam hodnot osi
+        """
+        axes = tuple(axis for axis, dim in enumerate(self.dims) if dim not in dims)
+        counts = self.counts.sum(axis=axes)
+        remaining = [dim for dim in self.dims if dim in dims]
+        counts = np.transpose(counts, [remaining.index(dim) for dim in dims])
+        return counts, [self.labels[dim] for dim in dims]
+
+    @property
+    def nbytes(self):
+        return self.counts.nbytes
+
+    def __repr__(self):
+        shape = " x ".join(f"{dim}={self.labels[dim].size}" for dim in self.dims)
+        return f"CountCube(column={self.column}, {shape})"
+
+
 class DataDownloader:
     """ TODO: dokumentacni retezce 
 
@@ -28,6 +511,17 @@ class DataDownloader:
         headers  -- Nazvy hlavicek jednotlivych CSV souboru, tyto nazvy nemente!  
         regions -- Dictionary s nazvy kraju : nazev csv souboru
         data_types -- Datove typy jednotlivych hlaviciek podla zoznamu headers
+        encoded_columns -- Retazcove stlpce, ktore sa pri encode_strings=True ukladaju ako EncodedColumn
+        region_cache -- RegionCache zdielana vsetkymi instanciami, velkost sa nastavi cez region_cache.max_bytes
+        http_headers -- HTTP hlavicky posielane pri stahovani dat
+        manifest_filename -- meno suboru v zlozke s informaciami o stiahnutych suboroch
+        download_chunk_size -- velkost bloku pri zapise stahovaneho suboru v bajtoch
+        cache_formats -- podporovane formaty cache suborov
+        zone_rows -- pocet riadkov jedneho bloku v mape blokov (zone map) manifestu regionu
+        zone_distinct_limit -- najvacsi pocet roznych hodnot celociselneho stlpca v bloku,
+                               pre ktory sa v mape blokov ulozi mnozina hodnot
+        cube_columns -- stlpce, pre ktore sa pri spracovani ulozia pocty nehod podla roku
+                        a mesiaca do manifestu regionu (pozri count_cube)
     """
 
     headers = ["p1", "p36", "p37", "p2a", "weekday(p2a)", "p2b", "p6", "p7", "p8", "p9", "p10", "p11", "p12", "p13a",
@@ -40,6 +534,18 @@ class DataDownloader:
                 "i1", "i1" , "i1", "i1", "i1", "i1", "i8", "i1", "i1", "i1", "f8", "f8","f8","f8","f8","f8","U32","U32",
                 "U32","U32","U32","U32","U32","U32","U32","U32","U32","U32", "i1"]
 
+    region_cache = RegionCache()
+
+    encoded_columns = ["p2b", "p47", "h", "i", "j", "k", "l", "n", "o", "p", "q", "r", "s", "t"]
+
+    http_headers = {"User-Agent" : "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/95.0.4638.54 Safari/537.36"}
+    manifest_filename = "manifest.json"
+    download_chunk_size = 1 << 20
+    cache_formats = ("pickle", "npy")
+    zone_rows = 16384
+    zone_distinct_limit = 32
+    cube_columns = ["p24", "p21", "p10", "p18"]
+
     regions = {
         "PHA": "00",
         "STC": "01",
@@ -57,74 +563,250 @@ class DataDownloader:
         "KVK": "19",
     }
 
-    def __init__(self, url="https://ehw.fit.vutbr.cz/izv/", folder="data", cache_filename="data_{}.pkl.gz"):
+    def __init__(self, url="https://ehw.fit.vutbr.cz/izv/", folder="data", cache_filename="data_{}.pkl.gz",
+                 cache_format="pickle", cache_dirname="data_{}", encode_strings=False):
         """Inicializacia triedy a spracovanie vstupnych dat 
 
         Keyword arguments:
         url -- stranka z ktorej sa budu stahovat data (default "https://ehw.fit.vutbr.cz/izv/")
         folder -- zlozka do ktorej sa budu ukladat docasne data, nemusi existovat (default "data")
         cache_filename -- meno suboru v specifikovanej zlozke, za '{}' sa doplni kod kraja (default "data_{}.pkl.gz")
+        cache_format -- format cache, "pickle" (gzip + pickle v cache_filename) alebo "npy"
+                        (jeden .npy subor na stlpec v cache_dirname, nacitava sa cez mmap) (default "pickle")
+        cache_dirname -- meno zlozky pre format "npy", za '{}' sa doplni kod kraja (default "data_{}")
+        encode_strings -- stlpce z encoded_columns sa spracuju, ulozia do cache a vratia
+                          ako EncodedColumn (kody + slovnik) namiesto pola retazcov (default False)
         """
+        if cache_format not in self.cache_formats:
+            raise ValueError(f"Neznamy format cache {cache_format}, podporovane su {self.cache_formats}")
 
         self.url = url
         self.folder = folder
         self.cache_filename = cache_filename
-        self.cached_regions = {
-        "PHA": None,
-        "STC": None,
-        "JHC": None,
-        "PLK": None,
-        "ULK": None,
-        "HKK": None,
-        "JHM": None,
-        "MSK": None,
-        "OLK": None,
-        "ZLK": None,
-        "VYS": None,
-        "PAK": None,
-        "LBK": None,
-        "KVK": None,
-        }   
-
-    def download_data(self):
+        self.cache_format = cache_format
+        self.cache_dirname = cache_dirname
+        self.encode_strings = encode_strings
+        # pocet vynechanych duplicitnych riadkov pre kazdy region a zip subor
+        self.dropped_duplicates = {}
+        # casy, bajty a riadky jednotlivych faz spracovania
+        self.stats = IngestStats()
+
+    def _cache_key(self, region):
+        """Kluc regionu v zdielanej cache pamati, rozlisuje zlozku, cache subor a kodovanie"""
+        return (os.path.abspath(self._cache_path(region)), self.encode_strings, region)
+
+    def _cache_stamp(self, region):
+        """Znacka cache suboru regionu (pri formate "npy" hlavicky): cas zmeny, velkost a inode, None ak neexistuje
+
+        Zapis cache subor vzdy nahradi cez os.replace, preto sa znacka pri kazdom zapise zmeni.
+        """
+        path = self._cache_path(region)
+        if self.cache_format == "npy":
+            path = os.path.join(path, "header.json")
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _cached(self, region):
+        """Vrati data regionu z cache pamate alebo None, ak sa cache subor medzitym zmenil vrati tiez None"""
+        return self.region_cache.get(self._cache_key(region), self._cache_stamp(region))
+
+    def _remember(self, region, data, stamp=None):
+        """Ulozi data regionu do cache pamate
+
+        Keyword arguments:
+            stamp -- znacka cache suboru, z ktoreho data pochadzaju (default "None") - aktualna znacka,
+                     data preto treba ulozit az po zapise cache suboru
+        """
+        self.region_cache.put(self._cache_key(region), data, self._cache_stamp(region) if stamp is None else stamp)
+
+    def download_data(self, workers=4):
         """Zo stranky sa stiahnu zip subory s datami
+
+        Subory sa stahuju paralelne cez jednu spolocnu session. Do zlozky sa
+        uklada manifest s velkostou, ETag a Last-Modified kazdeho suboru,
+        nezmenene subory sa znova nestahuju. Subor sa stahuje do docasneho
+        suboru ".part", prerusene stahovanie sa dokonci a hotovy subor sa
+        atomicky premenuje.
+
+        Keyword arguments:
+        workers -- pocet sucasne stahovanych suborov (default 4)
+
+        Returns:
+        zoznam nazvov suborov, ktore sa naozaj stiahli
         """
         # ak neexistuje adresar, vytvorime ho
         if not os.path.exists(self.folder):
             os.makedirs(self.folder)
 
-        headers = {"User-Agent" : "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/95.0.4638.54 Safari/537.36"}
         with requests.Session() as s:
-            page = s.get(self.url, headers = headers)
+            s.headers.update(self.http_headers)
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+
+            with self.stats.stage("network") as counts:
+                page = s.get(self.url)
+                counts["bytes"] = len(page.content)
             # vyhladanie linkov cez button na stranke
             result = BeautifulSoup(page.text, "html.parser")
             button_tags = result.findAll(class_='btn btn-sm btn-primary')
             last_month = button_tags[-1].get('onclick').split('\'')[1]
 
+            file_names = []
             for tag in button_tags:
                 file_name = tag.get('onclick').split('\'')[1]
                 numbers = sum(c.isdigit() for c in file_name)
                 # stiahne sa len posledny mesiac v kazdom roku
                 if numbers == 4 or file_name == last_month:
-                    download_url = self.url + file_name
-                    download_request = requests.get(download_url, stream=True)
-                    # ulozenie dat do suboru
-                    with open(os.path.join(self.folder, file_name.split('/')[1]), 'wb') as fd:
-                        for chunk in download_request.iter_content(chunk_size=512):
-                            fd.write(chunk)
+                    file_names.append(file_name)
 
+            manifest = self._load_manifest()
+            lock = Lock()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self._download_file, s, file_name, manifest, lock)
+                           for file_name in file_names]
+                downloaded = [future.result() for future in futures]
 
-    def parse_region_data(self, region):
-        """Spracuju sa data do numpy poli zo zip suborov v zlozke
+        return [file_name for file_name in downloaded if file_name is not None]
 
-        Argumetns:
-            region -- nazov regionu pre ktory sa spracuju data zo zip suboru
+    def _load_manifest(self):
+        """Nacita manifest stiahnutych suborov, ak neexistuje vrati prazdny slovnik"""
+        try:
+            with open(os.path.join(self.folder, self.manifest_filename), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, manifest):
+        """Atomicky zapise manifest stiahnutych suborov"""
+        manifest_path = os.path.join(self.folder, self.manifest_filename)
+        with open(f"{manifest_path}.{os.getpid()}.tmp", 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(f"{manifest_path}.{os.getpid()}.tmp", manifest_path)
+
+    def _download_file(self, session, file_name, manifest, lock):
+        """Stiahne jeden subor, ak sa na serveri zmenil alebo este nie je stiahnuty
+
+        Arguments:
+        session -- requests.Session zdielana medzi vlaknami
+        file_name -- cesta k suboru relativne k url (napr. "data/datagis-2016.zip")
+        manifest -- slovnik s informaciami o stiahnutych suboroch
+        lock -- zamok pre pristup k manifestu
+
+        Returns:
+        nazov stiahnuteho suboru alebo None ak sa subor nezmenil
+        """
+        name = file_name.split('/')[1]
+        path = os.path.join(self.folder, name)
+        part_path = path + ".part"
+        with lock:
+            entry = manifest.get(name, {})
+
+        headers = {}
+        complete = entry.get("complete") and os.path.exists(path) and os.path.getsize(path) == entry.get("size")
+        validator = entry.get("etag") or entry.get("last_modified")
+        if complete:
+            # podmienene stiahnutie, server vrati 304 ak sa subor nezmenil
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        elif os.path.exists(part_path) and validator:
+            # dokoncenie preruseneho stahovania, ak sa subor medzitym nezmenil
+            headers["Range"] = f"bytes={os.path.getsize(part_path)}-"
+            headers["If-Range"] = validator
+
+        with self.stats.stage("network") as counts, \
+                session.get(self.url + file_name, headers=headers, stream=True) as response:
+            if response.status_code == 304:
+                return None
+            if response.status_code == 416:
+                # cast suboru je neplatna, stiahnem ho znova od zaciatku
+                os.remove(part_path)
+                return self._download_file(session, file_name, manifest, lock)
+            response.raise_for_status()
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            unchanged = etag == entry.get("etag") if etag else last_modified == entry.get("last_modified")
+            if complete and unchanged and (etag or last_modified):
+                # server nepodporuje podmienene poziadavky, ale subor sa nezmenil
+                return None
+
+            with lock:
+                manifest[name] = {"etag": etag, "last_modified": last_modified, "complete": False}
+                self._save_manifest(manifest)
+
+            # 206 -> pokracujem v stahovani, inak stahujem od zaciatku
+            mode = 'ab' if response.status_code == 206 else 'wb'
+            with open(part_path, mode) as fd:
+                for chunk in response.iter_content(chunk_size=self.download_chunk_size):
+                    fd.write(chunk)
+                    counts["bytes"] += len(chunk)
+
+        # hotovy subor atomicky presuniem na cielove miesto
+        os.replace(part_path, path)
+        with lock:
+            manifest[name] = {"etag": etag, "last_modified": last_modified,
+                              "size": os.path.getsize(path), "complete": True}
+            self._save_manifest(manifest)
+        return name
+
+    @staticmethod
+    def _convert_column(values, data_type):
+        """Prevedie cely stlpec retazcov naraz na zadany datovy typ
+
+        Chybajuce a neplatne hodnoty sa nahradia ako pri spracovani po bunkach:
+        integer -> -1, datum -> NaT, float -> NaN. Kazda rozna hodnota sa prevedie
+        len raz, hodnoty ktore sa nedaju previest hromadne (napr. "XX" v integer
+        stlpci) sa skusia previest po jednej.
+
+        Arguments:
+            values -- numpy pole retazcov jedneho stlpca
+            data_type -- cielovy datovy typ stlpca (napr. "i1", "f8", "M8[D]", "U32")
+        """
+        if "U" in data_type:
+            return values.astype(data_type)
+
+        # kazdu roznu hodnotu v stlpci prevediem len raz, vysledok rozlozim spat podla indexov
+        distinct, inverse = np.unique(values, return_inverse=True)
+
+        if "M" in data_type:
+            # prazdny retazec numpy prevedie priamo na NaT
+            try:
+                return distinct.astype(data_type)[inverse]
+            except ValueError:
+                converted = np.empty(distinct.size, dtype=data_type)
+                for i, value in enumerate(distinct):
+                    converted[i] = np.datetime64(value)
+                return converted[inverse]
+
+        if "f" in data_type:
+            # desatinna ciarka -> bodka, hodnoty sa parsuju ako float32 (rovnako ako povodne "f")
+            distinct = np.char.replace(distinct, ",", ".")
+            missing, parse_type = np.nan, "f"
+        else:
+            missing, parse_type = -1, data_type
+
+        converted = np.full(distinct.size, missing, dtype=data_type)
+        # hromadne prevediem hodnoty v tvare [+-]cislice[.cislice]
+        unsigned = np.char.lstrip(distinct, "+-")
+        digits = np.char.replace(unsigned, ".", "", 1) if "f" in data_type else unsigned
+        valid = np.char.isdecimal(digits) & (np.char.str_len(distinct) - np.char.str_len(unsigned) <= 1)
+        converted[valid] = distinct[valid].astype(parse_type)
+        # ostatne neprazdne hodnoty skusim previest po jednej
+        for i in np.flatnonzero(~valid & (distinct != '')):
+            try:
+                converted[i] = np.array(distinct[i]).astype(parse_type)
+            except ValueError:
+                pass
+        return converted[inverse]
+
+    def _zip_files(self):
+        """Vrati zoznam zip suborov v zlozke, ak ziadne nie su tak data najprv stiahne
         """
-        
-        # kontrola spravnosti regionu
-        if region not in self.regions.keys():
-            print(f"ERROR: {region} nie je platna skratka regionu", file=sys.stderr)
-            return
         # ak neexistuje adresar tak stiahnem data
         if not os.path.exists(self.folder):
             self.download_data()
@@ -133,88 +815,854 @@ class DataDownloader:
         zip_files = [file for file in onlyfiles if file.endswith(".zip")]
         if len(zip_files) == 0:
             self.download_data()
+            onlyfiles = [f for f in os.listdir(self.folder) if os.path.isfile(os.path.join(self.folder, f))]
+            zip_files = [file for file in onlyfiles if file.endswith(".zip")]
+        # pevne poradie zip suborov, aby prvy vyskyt duplicitneho zaznamu nezavisel od os.listdir
+        return sorted(zip_files, key=self._archive_order)
+
+    @staticmethod
+    def _archive_order(zip_file):
+        """Kluc poradia zip suborov podla obdobia, ktore pokryvaju (rok, mesiac)
+
+        Rocny subor datagis-YYYY.zip pokryva cely rok a radi sa ako mesiac 12
+        (za mesacnym suborom datagis-12-YYYY.zip), mesacny datagis-MM-YYYY.zip
+        ako mesiac MM. Novy mesiac sa tak radi za vsetky starsie roky, hoci jeho
+        meno je v abecednom poradi pred nimi. Subory s inym menom sa radia na koniec.
+
+        Returns:
+            (rok, mesiac, meno suboru)
+        """
+        match = re.search(r"(?:(\d{1,2})-)?(\d{4})\.zip$", zip_file)
+        if match is None:
+            return (10000, 0, zip_file)
+        return (int(match.group(2)), int(match.group(1) or 12), zip_file)
+
+    def _rows_to_chunk(self, rows, region):
+        """Prevedie zoznam riadkov CSV na slovnik typovanych numpy poli (jeden blok dat)
+
+        Arguments:
+            rows -- zoznam riadkov, kazdy riadok je zoznam retazcov
+            region -- skratka regionu, doplni sa ako posledny stlpec
+        """
+        with self.stats.stage("convert", rows=len(rows)) as counts:
+            # transponujem riadky na stlpce, kratsie riadky doplnim prazdnymi bunkami
+            columns = islice(zip_longest(*rows, fillvalue=''), len(self.headers))
+            np_arrays = [np.array(column, dtype=str) for column in columns]
+            np_arrays += [np.full(len(rows), '') for _ in range(len(self.headers) - len(np_arrays))]
+
+            chunk = {}
+            # kazdy stlpec prevediem naraz na cielovy datovy typ
+            for i in range(len(self.headers)):
+                chunk[self.headers[i]] = self._convert_column(np_arrays[i], self.data_types[i])
+                if self.encode_strings and self.headers[i] in self.encoded_columns:
+                    chunk[self.headers[i]] = EncodedColumn.encode(chunk[self.headers[i]])
+            chunk["region"] = np.full(len(rows), region, dtype="U3")
+            counts["bytes"] = sum(values.nbytes for values in chunk.values())
+        return chunk
+
+    @staticmethod
+    def _drop_duplicates(chunk, seen):
+        """Z bloku odstrani riadky s uz videnym p1, ponecha sa len prvy vyskyt
+
+        Arguments:
+            chunk -- slovnik numpy poli jedneho bloku
+            seen -- zoradene pole hodnot p1 z predchadzajucich blokov
+
+        Returns:
+            (chunk, seen, dropped) -- blok bez duplicit, aktualizovane pole videnych p1
+            a pole p1 vynechanych riadkov
+        """
+        p1 = chunk["p1"]
+        # prvy vyskyt kazdej hodnoty v bloku, ktora nebola v predchadzajucich blokoch
+        _, first = np.unique(p1, return_index=True)
+        keep = np.zeros(p1.size, dtype=bool)
+        keep[first] = True
+        # seen je zoradene, clenstvo aj vlozenie novych hodnot cez searchsorted (bez noveho triedenia seen)
+        positions = np.searchsorted(seen, p1)
+        found = positions < seen.size
+        found[found] = seen[positions[found]] == p1[found]
+        keep &= ~found
+        new = np.sort(p1[keep])
+        seen = np.insert(seen, np.searchsorted(seen, new), new)
+        dropped = p1[~keep]
+        if dropped.size:
+            chunk = {key: values[keep] for key, values in chunk.items()}
+        return chunk, seen, dropped
+
+    def iter_region_chunks(self, region, chunk_rows=65536):
+        """Postupne spracuje data regionu zo zip suborov v zlozke po blokoch
+
+        Kazdy zip subor sa cita len raz a v pamati je naraz najviac chunk_rows
+        riadkov CSV. Zip subory sa prechadzaju v abecednom poradi a duplicitne
+        zaznamy (podla p1) sa vynechaju aj napriec zip subormi, ponecha sa prvy
+        vyskyt. Pocty vynechanych riadkov pre kazdy zip subor sa ulozia
+        do dropped_duplicates[region].
+
+        Arguments:
+            region -- nazov regionu pre ktory sa spracuju data zo zip suboru
 
-        np_arrays_result = [np.empty(0, dtype=self.data_types[i]) for i in range(len(self.headers))]
+        Keyword arguments:
+            chunk_rows -- maximalny pocet riadkov v jednom bloku (default 65536)
 
+        Yields:
+            slovnik s numpy poliami pre kazdu hlavicku a stlpcom "region"
+        """
+        # kontrola spravnosti regionu
+        if region not in self.regions.keys():
+            print(f"ERROR: {region} nie je platna skratka regionu", file=sys.stderr)
+            return
 
+        dedup = self._new_dedup()
+        self.dropped_duplicates[region] = dedup["dropped"]
         # prechadzam zip subory
-        for zip_file in zip_files:
-            # otvorim si zip pomocou ZipFile
+        for zip_file in self._zip_files():
+            # otvorim si zip pomocou ZipFile a subor so zadanym regionom
             with ZipFile(os.path.join(self.folder, zip_file), 'r') as zip:
-                # otvorim si subor so zadanym regionom
-                with zip.open(self.regions[region] + ".csv", 'r') as file:
-
-                    reader = csv.DictReader(TextIOWrapper(file, "cp1250"), fieldnames=self.headers, delimiter=';')
-                    no_rows = len(list(reader))
-                    # kvoli zisteniu poctu riadok sa musim vratit na zaciatok suboru
-                    file.seek(0)
-                    # print(f"tento zip {zip_file} a tento subor {file.name} ma {no_rows}")
-                    
-                    np_arrays = [np.empty(no_rows, dtype=self.data_types[i]) for i in range(len(self.headers))]
-                    for row_n, row in enumerate(reader):
-                        # prechadzam kazdy stlpec v riadku
-                        for col in range(len(self.headers)):
-                            if row[self.headers[col]] == '' and "U" not in self.data_types[col]:
-                                # chybajuce hodnoty v stlpoch
-                                if "i" in self.data_types[col]:
-                                    # chyba integer
-                                    np_arrays[col][row_n] = -1
-                                if "M" in self.data_types[col]:
-                                    # chyba datum
-                                    np_arrays[col][row_n] = np.datetime64("nat")
-                                if "f" in self.data_types[col]:
-                                    # chyba float
-                                    np_arrays[col][row_n] = np.nan
-                            # nastavim numpy datum
-                            if "M" in self.data_types[col]:
-                                np_arrays[col][row_n] = np.datetime64(row[self.headers[col]])
-                            # nastavim floaty
-                            elif "f" in self.data_types[col]:
-                                try:
-                                    np_arrays[col][row_n] = np.char.replace(row[self.headers[col]], ",", ".").astype("f")
-                                except ValueError:
-                                     np_arrays[col][row_n] = np.nan
-                            # nastavim integere
-                            else:
-                                try:
-                                    np_arrays[col][row_n] = row[self.headers[col]]
-                                except ValueError:
-                                     np_arrays[col][row_n] = -1
-                    
-                    # skontrolujem este duplicity
-                    x = np_arrays[0].copy() #p1
-                    indices, counts = np.unique(x, return_counts=True)
-                    duplicates = indices[np.argwhere(counts > 1).flatten()]
-                    # pre kazdu duplicitu
-                    for duplic in duplicates:
-                        # indexy odkial sa budu vymazavat
-                        # ponecham len prvy vyskyt p1, ostatne vymazem
-                        z = np.where(duplic == x)[0][1:]
-                        # prejdem kazdy zoznam a vymazem duplicitne riadky
-                        for i in range(len(np_arrays)):
-                            np_arrays[i] = np.delete(np_arrays[i], z)
-
-                    # naplnim finalne numpy arraye
-                    for i in range(len(np_arrays_result)):
-                            np_arrays_result[i] = np.append(np_arrays_result[i], np_arrays[i])
-                    
-        # vytvorim slovnik
+                yield from self._iter_member_chunks(zip, region, chunk_rows, dedup)
+
+    def _new_dedup(self):
+        """Vytvori stav odstranovania duplicit jedneho regionu
+
+        Returns:
+            slovnik s polozkami "seen" (zoradene pole uz videnych p1) a "dropped" (pocet
+            vynechanych riadkov pre kazdy zip subor)
+        """
+        return {"seen": np.empty(0, dtype=self.data_types[0]), "dropped": {}}
+
+    def _iter_member_chunks(self, zip, region, chunk_rows, dedup):
+        """Po blokoch spracuje CSV subor regionu z jedneho otvoreneho zip suboru
+
+        Arguments:
+            zip -- otvoreny ZipFile
+            region -- skratka regionu, urcuje meno CSV suboru v zipe
+            chunk_rows -- maximalny pocet riadkov v jednom bloku
+            dedup -- stav odstranovania duplicit regionu (z _new_dedup), aktualizuje sa
+        """
+        archive = os.path.basename(zip.filename)
+        dedup["dropped"][archive] = 0
+        with zip.open(self.regions[region] + ".csv", 'r') as file:
+            # prazdne riadky preskocim (ako DictReader)
+            # cas citania zo zipu sa zapocita do "unzip", dekodovanie cp1250 a CSV do "decode"
+            unzipped = _TimedReader(file, self.stats, "unzip")
+            reader = csv.reader(TextIOWrapper(unzipped, "cp1250"), delimiter=';')
+            rows_iter = (row for row in reader if row)
+            total_rows = 0
+            while True:
+                # bajty "decode" su rozbalene bajty precitane pocas dekodovania bloku
+                unzipped_before = unzipped.total
+                with self.stats.stage("decode") as counts:
+                    rows = list(islice(rows_iter, chunk_rows))
+                    counts["rows"] = len(rows)
+                    counts["bytes"] = unzipped.total - unzipped_before
+                total_rows += len(rows)
+                if not rows:
+                    # riadky rozbaleneho suboru sa zapocitaju do "unzip" bez noveho volania
+                    self.stats.add("unzip", 0.0, rows=total_rows, calls=0)
+                    break
+                chunk = self._rows_to_chunk(rows, region)
+                with self.stats.stage("dedup", rows=len(rows)):
+                    chunk, dedup["seen"], dropped = self._drop_duplicates(chunk, dedup["seen"])
+                dedup["dropped"][archive] += dropped.size
+                if chunk["p1"].size:
+                    yield chunk
+
+    def _stack_chunks(self, chunks, columns=None):
+        """Spoji bloky dat (alebo data viacerych regionov) do jedneho slovnika
+
+        Velkost vysledku sa zisti dopredu, kazdy stlpec sa alokuje len raz
+        a bloky sa don skopiruju na svoje miesto. Jediny blok s polom len na
+        citanie (napr. namapovana cache "npy") sa vrati bez kopirovania.
+        Stlpce z encoded_columns sa vratia ako EncodedColumn, ak je zapnute
+        encode_strings, inak ako dekodovane polia.
+
+        Arguments:
+            chunks -- zoznam slovnikov numpy poli
+
+        Keyword arguments:
+            columns -- zoznam stlpcov, ktore sa spoja (default "None") - vsetky stlpce
+        """
+        # datove typy vsetkych stlpcov vratane stlpca s regionom
+        column_types = dict(zip(self.headers, self.data_types), region="U3")
+        if columns is None:
+            columns = list(column_types.keys())
+        rows = sum(len(chunk[columns[0]]) for chunk in chunks) if columns else 0
+
         dict_data = {}
-        region_array = np.full(np_arrays_result[0].size, region, dtype="U3")
-        # naplnim slovnik numpy poliami
-        for i in range(len(np_arrays_result)):
-            dict_data[self.headers[i]] = np_arrays_result[i]
-        # pridam posledny stlpec s kodom regionu
-        dict_data["region"] = region_array
-        
+        with self.stats.stage("stack", rows=rows) as counts:
+            for column in columns:
+                parts = [chunk[column] for chunk in chunks]
+                if self.encode_strings and column in self.encoded_columns:
+                    # zakodovane stlpce spojim cez spolocny slovnik
+                    dict_data[column] = parts[0] if len(parts) == 1 and isinstance(parts[0], EncodedColumn) \
+                        else EncodedColumn.concatenate(parts)
+                    continue
+                if len(parts) == 1 and isinstance(parts[0], np.ndarray) and not parts[0].flags.writeable:
+                    dict_data[column] = parts[0]
+                    continue
+                dict_data[column] = np.empty(rows, dtype=column_types[column])
+                # bloky skopirujem za sebou do predalokovaneho pola (zakodovane sa dekoduju)
+                offset = 0
+                for part in parts:
+                    dict_data[column][offset:offset + len(part)] = part
+                    offset += len(part)
+                counts["bytes"] += dict_data[column].nbytes
         return dict_data
 
-    def get_dict(self, regions=None):
+    def parse_region_data(self, region):
+        """Spracuju sa data do numpy poli zo zip suborov v zlozke
+
+        Argumetns:
+            region -- nazov regionu pre ktory sa spracuju data zo zip suboru
+        """
+        
+        # kontrola spravnosti regionu
+        if region not in self.regions.keys():
+            print(f"ERROR: {region} nie je platna skratka regionu", file=sys.stderr)
+            return
+
+        return self._stack_chunks(list(self.iter_region_chunks(region)))
+
+    def ingest_all(self, regions=None, chunk_rows=65536, workers=None):
+        """Spracuje data vsetkych zadanych regionov pri jednom prechode zip suborov
+        a ulozi ich do cache pamate aj do cache suborov
+
+        Kazdy zip subor sa otvori len raz a spracuju sa z neho CSV subory
+        vsetkych regionov, na rozdiel od opakovaneho volania parse_region_data.
+
+        Keyword arguments:
+            regions -- Zoznam regionov na spracovanie (default "None") - vsetky regiony
+            chunk_rows -- maximalny pocet riadkov v jednom bloku (default 65536)
+            workers -- pocet procesov, ak je vacsi ako 1 spracuje sa kazdy region
+                       v samostatnom procese a cache subory zapisu procesy (default "None")
+
+        Returns:
+            slovnik region: spracovane data regionu
+        """
+        if regions is None:
+            regions = list(self.regions.keys())
+        elif any(region not in self.regions.keys() for region in regions):
+            print(f"ERROR: Zadany zoznam regionov obsahuje neplatny region", file=sys.stderr)
+            return
+
+        if workers is not None and workers > 1 and len(regions) > 1:
+            # data stiahnem este pred spustenim procesov, aby ich nestahoval kazdy proces
+            self._zip_files()
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {region: executor.submit(_ingest_regions, self, [region], chunk_rows) for region in regions}
+                # vysledky ukladam v poradi regionov, nie v poradi dokoncenia
+                parsed = {}
+                for region in regions:
+                    result, stages = futures[region].result()
+                    parsed[region], self.dropped_duplicates[region] = result[region]
+                    self.stats.merge(stages)
+                    self._remember(region, parsed[region])
+            return parsed
+
+        zip_files = self._zip_files()
+        dedups = {region: self._new_dedup() for region in regions}
+        chunks, archives = self._ingest_archives({region: zip_files for region in regions}, chunk_rows, dedups)
+
+        parsed = {}
+        for region in regions:
+            parsed[region] = self._stack_chunks(chunks.pop(region))
+            # ulozim si ich do cache suboru spolu s manifestom zdrojovych zip suborov a do pamate
+            self.dropped_duplicates[region] = dedups[region]["dropped"]
+            cache_info = self._save_cache(region, parsed[region])
+            self._save_meta(region, dict(cache_info, rows=len(parsed[region]["p1"]), archives=archives[region],
+                                         zones=self._zone_map(parsed[region]), cube=self._cube_counts(parsed[region])))
+            self._remember(region, parsed[region])
+        return parsed
+
+    def _ingest_archives(self, region_archives, chunk_rows, dedups):
+        """Spracuje zadane zip subory pre zadane regiony, kazdy zip subor sa otvori len raz
+
+        Arguments:
+            region_archives -- slovnik region: zoznam zip suborov, ktore sa maju spracovat
+            chunk_rows -- maximalny pocet riadkov v jednom bloku
+            dedups -- slovnik region: stav odstranovania duplicit (z _new_dedup)
+
+        Returns:
+            (chunks, archives) -- pre kazdy region zoznam blokov dat a zoznam zaznamov manifestu
+            {"name", "sha1", "start", "stop", "dropped"}, rozsah riadkov je relativny k blokom
+        """
+        chunks = {region: [] for region in region_archives}
+        archives = {region: [] for region in region_archives}
+        rows = dict.fromkeys(region_archives, 0)
+        # kazdy zip subor prejdem len raz pre vsetky regiony, ktore ho potrebuju
+        for zip_file in sorted(set().union(*region_archives.values()), key=self._archive_order):
+            zip_hash = self._file_hash(os.path.join(self.folder, zip_file))
+            with ZipFile(os.path.join(self.folder, zip_file), 'r') as zip:
+                for region in region_archives:
+                    if zip_file not in region_archives[region]:
+                        continue
+                    new_chunks = list(self._iter_member_chunks(zip, region, chunk_rows, dedups[region]))
+                    new_rows = sum(len(chunk["p1"]) for chunk in new_chunks)
+                    chunks[region].extend(new_chunks)
+                    archives[region].append({"name": zip_file, "sha1": zip_hash, "start": rows[region],
+                                             "stop": rows[region] + new_rows,
+                                             "dropped": dedups[region]["dropped"][zip_file]})
+                    rows[region] += new_rows
+        return chunks, archives
+
+    def _file_hash(self, path):
+        """Vrati SHA-1 obsahu suboru"""
+        sha1 = hashlib.sha1()
+        with self.stats.stage("hash", nbytes=os.path.getsize(path)), open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(block)
+        return sha1.hexdigest()
+
+    def update_cache(self, regions=None, chunk_rows=65536):
+        """Doplni do cache regionov len nove alebo zmenene zip subory
+
+        Manifest regionu (subor .json vedla cache) obsahuje pre kazdy zdrojovy
+        zip subor jeho meno, SHA-1, rozsah riadkov v cache a pocet vynechanych
+        duplicit. Duplicity sa vynechavaju podla prveho vyskytu v poradi obdobi
+        zip suborov (pozri _archive_order), preto sa z cache prevezmu len riadky
+        nezmenenych zip suborov pred prvym novym, zmenenym alebo odstranenym zip
+        suborom. Ten a vsetky nasledujuce zip subory sa spracuju znova (kazdy len
+        raz pre vsetky regiony), vysledok je rovnaky ako pri spracovani vsetkych
+        zip suborov. Pridanie noveho mesiaca alebo roku spracuje len novy zip
+        subor. Regiony bez cache alebo bez manifestu sa spracuju cele cez
+        ingest_all.
+
+        Keyword arguments:
+            regions -- Zoznam regionov na aktualizaciu (default "None") - vsetky regiony
+            chunk_rows -- maximalny pocet riadkov v jednom bloku (default 65536)
+
+        Returns:
+            slovnik region: zoznam zip suborov, ktore sa pre region spracovali
+        """
+        if regions is None:
+            regions = list(self.regions.keys())
+        elif any(region not in self.regions.keys() for region in regions):
+            print(f"ERROR: Zadany zoznam regionov obsahuje neplatny region", file=sys.stderr)
+            return
+
+        # pocas aktualizacie drzim vyhradne zamky vsetkych regionov (v pevnom poradi)
+        with ExitStack() as locks:
+            for region in sorted(regions):
+                locks.enter_context(self._region_lock(region))
+            return self._update_locked(regions, chunk_rows)
+
+    def _update_locked(self, regions, chunk_rows):
+        """Aktualizacia cache regionov pre update_cache, volajuci drzi zamky regionov"""
+        zip_files = self._zip_files()
+        zip_hashes = {zip_file: self._file_hash(os.path.join(self.folder, zip_file)) for zip_file in zip_files}
+
+        rebuild, kept, to_parse = [], {}, {}
+        dedups, old_data = {}, {}
+        for region in regions:
+            meta = self._load_meta(region)
+            if meta is None or not self._cache_exists(region):
+                rebuild.append(region)
+                continue
+            # duplicity sa vynechavaju podla prveho vyskytu v poradi obdobi zip suborov, ponecham preto len
+            # nezmenene zip subory pred prvym novym, zmenenym alebo odstranenym, vsetky dalsie spracujem znova
+            old_names = {archive["name"] for archive in meta["archives"]}
+            changed = [archive["name"] for archive in meta["archives"] if zip_hashes.get(archive["name"]) != archive["sha1"]]
+            changed += [zip_file for zip_file in zip_files if zip_file not in old_names]
+            if not changed:
+                # region je aktualny
+                continue
+            first_change = min(map(self._archive_order, changed))
+            kept[region] = [archive for archive in meta["archives"]
+                            if self._archive_order(archive["name"]) < first_change]
+            to_parse[region] = [zip_file for zip_file in zip_files if self._archive_order(zip_file) >= first_change]
+
+            old_data[region] = self._cached(region)
+            if old_data[region] is None:
+                old_data[region] = self._load_cache(region)
+            if old_data[region] is None:
+                # poskodenu cache spracujem celu znova
+                rebuild.append(region)
+                del kept[region], to_parse[region]
+                continue
+
+            # nove riadky porovnam so vsetkymi ponechanymi p1
+            dedups[region] = self._new_dedup()
+            dedups[region]["seen"] = np.unique(np.concatenate(
+                [np.empty(0, dtype=self.data_types[0])]
+                + [old_data[region]["p1"][archive["start"]:archive["stop"]] for archive in kept[region]]))
+
+        if rebuild:
+            self.ingest_all(rebuild, chunk_rows)
+
+        chunks, archives = self._ingest_archives(to_parse, chunk_rows, dedups)
+
+        for region in kept:
+            new_data = self._stack_chunks(chunks.pop(region))
+            # ponechane zip subory su v poradi obdobi pred vsetkymi spracovanymi
+            segments = [(archive, old_data[region]) for archive in kept[region]]
+            segments += [(archive, new_data) for archive in archives[region]]
+
+            parts, region_archives, rows = [], [], 0
+            for archive, data in segments:
+                parts.append({key: values[archive["start"]:archive["stop"]] for key, values in data.items()})
+                size = archive["stop"] - archive["start"]
+                entry = dict(archive, start=rows, stop=rows + size)
+                # manifest starsej verzie obsahoval aj p1 vynechanych duplicit
+                entry.pop("dropped_ids", None)
+                region_archives.append(entry)
+                rows += size
+
+            updated_region = self._stack_chunks(parts)
+            self.dropped_duplicates[region] = {archive["name"]: archive["dropped"] for archive in region_archives}
+            cache_info = self._save_cache(region, updated_region)
+            self._save_meta(region, dict(cache_info, rows=rows, archives=region_archives,
+                                         zones=self._zone_map(updated_region), cube=self._cube_counts(updated_region)))
+            self._remember(region, updated_region)
+
+        result = {region: list(zip_files) for region in rebuild}
+        result.update(to_parse)
+        return result
+
+    def _zone_map(self, data):
+        """Vytvori mapu blokov (zone map) dat regionu pre manifest
+
+        Pre kazdy blok zone_rows riadkov sa ulozi minimum a maximum kazdeho
+        ciselneho a datumoveho stlpca (None ak blok nema platnu hodnotu) a pre
+        celociselne stlpce s najviac zone_distinct_limit roznymi hodnotami aj
+        zoznam tychto hodnot.
+
+        Returns:
+            zoznam blokov {"start", "stop", "min", "max", "values"}
+        """
+        zones = []
+        rows = len(data["region"])
+        for start in range(0, rows, self.zone_rows):
+            stop = min(start + self.zone_rows, rows)
+            zone = {"start": start, "stop": stop, "min": {}, "max": {}, "values": {}}
+            for header, data_type in zip(self.headers, self.data_types):
+                if "U" in data_type:
+                    continue
+                values = np.asarray(data[header][start:stop])
+                if "M" in data_type:
+                    valid = values[~np.isnat(values)]
+                elif "f" in data_type:
+                    valid = values[~np.isnan(values)]
+                else:
+                    valid = values
+                    distinct = np.unique(values)
+                    if distinct.size <= self.zone_distinct_limit:
+                        zone["values"][header] = distinct.tolist()
+                # datumy sa ulozia ako retazce "YYYY-MM-DD"
+                zone["min"][header] = (str(valid.min()) if "M" in data_type else valid.min().item()) if valid.size else None
+                zone["max"][header] = (str(valid.max()) if "M" in data_type else valid.max().item()) if valid.size else None
+            zones.append(zone)
+        return zones
+
+    def _filter_value(self, column, value):
+        """Prevedie hodnotu filtra alebo mapy blokov na typ porovnatelny so stlpcom (datumy na np.datetime64)"""
+        if column == "p2a":
+            return np.datetime64(value, "D")
+        return value
+
+    def _zone_matches(self, zone, filters):
+        """Zisti ci v bloku mozu byt riadky vyhovujuce filtru (pozri get_dict)"""
+        for column, condition in filters.items():
+            if column not in zone["min"]:
+                # pre retazcove stlpce mapa blokov nic neuklada
+                continue
+            if zone["min"][column] is None:
+                # blok nema ziadnu platnu hodnotu, NaN ani NaT filtru nevyhovuju
+                return False
+            low, high = self._filter_value(column, zone["min"][column]), self._filter_value(column, zone["max"][column])
+            if isinstance(condition, tuple):
+                if condition[0] is not None and high < self._filter_value(column, condition[0]):
+                    return False
+                if condition[1] is not None and low > self._filter_value(column, condition[1]):
+                    return False
+            elif column in zone["values"]:
+                if not set(zone["values"][column]) & set(condition):
+                    return False
+            elif all(not low <= self._filter_value(column, value) <= high for value in condition):
+                return False
+        return True
+
+    def _matching_zones(self, region, filters):
+        """Vrati zoznam rozsahov riadkov (start, stop) blokov regionu, ktore mozu vyhovovat filtru
+
+        Returns:
+            zoznam rozsahov alebo None, ak manifest regionu nema mapu blokov
+        """
+        meta = self._load_meta(region)
+        if meta is None or "zones" not in meta:
+            return None
+        return [(zone["start"], zone["stop"]) for zone in meta["zones"] if self._zone_matches(zone, filters)]
+
+    def _filter_rows(self, data, zones, filters, columns=None):
+        """Vyberie z dat regionu riadky vyhovujuce filtru, citaju sa len bloky zo zones
+
+        Arguments:
+            data -- data regionu
+            zones -- zoznam rozsahov (start, stop) alebo None - vsetky riadky
+            filters -- filter z get_dict
+
+        Keyword arguments:
+            columns -- stlpce vysledku (default "None") - vsetky stlpce
+        """
+        rows = len(data["region"])
+        if zones is None:
+            zones = [(0, rows)]
+        indexes = [np.empty(0, dtype=np.intp)]
+        for start, stop in zones:
+            stop = min(stop, rows)
+            mask = np.ones(stop - start, dtype=bool)
+            for column, condition in filters.items():
+                values = np.asarray(data[column][start:stop])
+                if isinstance(condition, tuple):
+                    if condition[0] is not None:
+                        mask &= values >= self._filter_value(column, condition[0])
+                    if condition[1] is not None:
+                        mask &= values <= self._filter_value(column, condition[1])
+                else:
+                    mask &= np.isin(values, [self._filter_value(column, value) for value in condition])
+            indexes.append(start + np.flatnonzero(mask))
+        indexes = np.concatenate(indexes)
+        return {column: data[column][indexes] for column in (columns or data.keys())}
+
+    def _empty_part(self):
+        """Vrati prazdne data regionu so spravnymi datovymi typmi stlpcov"""
+        part = {}
+        for column, data_type in zip(self.headers + ["region"], self.data_types + ["U3"]):
+            part[column] = np.empty(0, dtype=data_type)
+            if self.encode_strings and column in self.encoded_columns:
+                part[column] = EncodedColumn(np.empty(0, dtype=np.uint8), part[column])
+        return part
+
+    def summary(self, regions=None):
+        """Vrati suhrnne informacie o regionoch len z manifestov, bez nacitania dat
+
+        Regiony, ktore este nemaju cache, sa najprv spracuju.
+
+        Keyword arguments:
+            regions -- Zoznam regionov (default "None") - vsetky regiony
+
+        Returns:
+            slovnik region: {"rows", "archives", "min", "max", "values"}, min a max su
+            extremy ciselnych a datumovych stlpcov, values zoznamy hodnot celociselnych
+            stlpcov s malym poctom roznych hodnot
+        """
+        if regions is None:
+            regions = list(self.regions.keys())
+        elif any(region not in self.regions.keys() for region in regions):
+            print(f"ERROR: Zadany zoznam regionov obsahuje neplatny region", file=sys.stderr)
+            return
+
+        metas = self._region_metas(regions, lambda meta: "zones" in meta)
+
+        result = {}
+        for region in regions:
+            zones = metas[region]["zones"]
+            info = {"rows": metas[region]["rows"], "archives": [archive["name"] for archive in metas[region]["archives"]],
+                    "min": {}, "max": {}, "values": {}}
+            for zone in zones:
+                for column, value in zone["min"].items():
+                    if value is not None:
+                        low = info["min"].get(column)
+                        info["min"][column] = value if low is None or self._filter_value(column, value) < \
+                            self._filter_value(column, low) else low
+                        high = info["max"].get(column)
+                        info["max"][column] = zone["max"][column] if high is None or \
+                            self._filter_value(column, zone["max"][column]) > self._filter_value(column, high) else high
+            # zoznam hodnot stlpca je platny len ak ho ma kazdy blok
+            for column in set.intersection(*(set(zone["values"]) for zone in zones)) if zones else ():
+                info["values"][column] = sorted(set().union(*(zone["values"][column] for zone in zones)))
+            result[region] = info
+        return result
+
+    def _region_metas(self, regions, complete):
+        """Vrati manifesty regionov, chybajuce alebo neuplne manifesty najprv doplni
+
+        Region bez cache sa spracuje cez ingest_all, pri existujucej cache sa mapa
+        blokov a pocty pre count_cube prepocitaju z cache (napr. po zmene cube_columns).
+
+        Arguments:
+            regions -- zoznam regionov
+            complete -- funkcia, ktora pre manifest vrati True, ak obsahuje potrebne udaje
+
+        Returns:
+            slovnik region: manifest
+        """
+        metas = {region: self._load_meta(region) for region in regions}
+        missing = [region for region in regions if metas[region] is None or not complete(metas[region])]
+        if missing:
+            # manifesty doplnam pod vyhradnymi zamkami regionov (v pevnom poradi)
+            with ExitStack() as locks:
+                for region in sorted(missing):
+                    locks.enter_context(self._region_lock(region))
+                metas.update({region: self._load_meta(region) for region in missing})
+                rebuild = []
+                for region in missing:
+                    if metas[region] is not None and complete(metas[region]):
+                        # medzicasom ho doplnil iny proces
+                        continue
+                    data = self._load_cache(region) if metas[region] is not None else None
+                    if data is None:
+                        rebuild.append(region)
+                        continue
+                    metas[region].update(zones=self._zone_map(data), cube=self._cube_counts(data))
+                    self._save_meta(region, metas[region])
+                if rebuild:
+                    self.ingest_all(rebuild)
+                    metas.update({region: self._load_meta(region) for region in rebuild})
+        return metas
+
+    def _cube_counts(self, data):
+        """Spocita pocty nehod podla roku, mesiaca a hodnoty kazdeho stlpca z cube_columns
+
+        Returns:
+            slovnik stlpec: {"years", "months", "values", "counts"} pre manifest regionu,
+            counts je vnoreny zoznam tvaru (roky, mesiace, hodnoty)
+        """
+        dates = np.asarray(data["p2a"])
+        unknown = np.isnat(dates)
+        # nehody bez datumu maju rok aj mesiac -1
+        years = np.where(unknown, -1, dates.astype("M8[Y]").astype(np.int64) + 1970)
+        months = np.where(unknown, -1, dates.astype("M8[M]").astype(np.int64) % 12 + 1)
+        year_codes, year_labels = _encode_key(years)
+        month_codes, month_labels = _encode_key(months)
+
+        cube = {}
+        for column in self.cube_columns:
+            value_codes, value_labels = _encode_key(data[column])
+            shape = (year_labels.size, month_labels.size, value_labels.size)
+            keys = (year_codes * shape[1] + month_codes) * shape[2] + value_codes
+            counts = np.bincount(keys, minlength=int(np.prod(shape))).reshape(shape)
+            cube[column] = {"years": year_labels.tolist(), "months": month_labels.tolist(),
+                            "values": value_labels.tolist(), "counts": counts.tolist()}
+        return cube
+
+    def count_cube(self, column, regions=None):
+        """Vrati kocku poctov nehod region x rok x mesiac x hodnota stlpca
+
+        Pocty sa pocitaju pri spracovani dat a ukladaju sa do manifestu regionu,
+        kocka sa preto zlozi bez nacitania dat regionov (regiony bez cache sa
+        najprv spracuju).
+
+        Arguments:
+            column -- stlpec z cube_columns
+
+        Keyword arguments:
+            regions -- Zoznam regionov (default "None") - vsetky regiony
+
+        Returns:
+            CountCube s regionmi v abecednom poradi
+        """
+        if column not in self.cube_columns:
+            print(f"ERROR: Pre stlpec {column} sa pocty neukladaju, pozri cube_columns", file=sys.stderr)
+            return
+        if regions is None:
+            regions = list(self.regions.keys())
+        elif any(region not in self.regions.keys() for region in regions):
+            print(f"ERROR: Zadany zoznam regionov obsahuje neplatny region", file=sys.stderr)
+            return
+
+        metas = self._region_metas(regions, lambda meta: column in meta.get("cube", {}))
+        parts = []
+        for region in sorted(regions):
+            entry = metas[region]["cube"][column]
+            labels = {"region": np.array([region]), "year": np.array(entry["years"], dtype=np.int64),
+                      "month": np.array(entry["months"], dtype=np.int64),
+                      "value": np.array(entry["values"], dtype=dict(zip(self.headers, self.data_types))[column])}
+            counts = np.array(entry["counts"], dtype=np.int64).reshape(
+                1, labels["year"].size, labels["month"].size, labels["value"].size)
+            parts.append(CountCube(column, counts, labels))
+        return CountCube.merge(column, parts)
+
+    def _meta_path(self, region):
+        """Vrati cestu k suboru s manifestom (metadatami) cache regionu
+
+        Manifest patri ku konkretnemu cache suboru, aby sa cache "pickle" a "npy"
+        (alebo cache s inym cache_filename) v jednej zlozke navzajom neprepisovali.
+        """
+        return self._cache_path(region) + ".json"
+
+    def _load_meta(self, region):
+        """Nacita manifest cache regionu, ak neexistuje vrati None"""
+        try:
+            with open(self._meta_path(region), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_meta(self, region, meta):
+        """Atomicky zapise manifest cache regionu"""
+        meta_path = self._meta_path(region)
+        with open(f"{meta_path}.{os.getpid()}.tmp", 'w') as f:
+            json.dump(meta, f, indent=1)
+        os.replace(f"{meta_path}.{os.getpid()}.tmp", meta_path)
+
+    def _cache_path(self, region):
+        """Vrati cestu k cache suboru (pri formate "npy" k cache zlozke) regionu"""
+        if self.cache_format == "npy":
+            return os.path.join(self.folder, self.cache_dirname.replace("{}", region))
+        return os.path.join(self.folder, self.cache_filename.replace("{}", region))
+
+    def _cache_exists(self, region):
+        """Zisti ci existuje kompletny cache subor regionu"""
+        if self.cache_format == "npy":
+            # hlavicka sa zapisuje az po vsetkych stlpcoch
+            return os.path.exists(os.path.join(self._cache_path(region), "header.json"))
+        return os.path.exists(self._cache_path(region))
+
+    @contextmanager
+    def _region_lock(self, region, shared=False):
+        """Zamok cache suborov regionu zdielany vsetkymi procesmi nad rovnakou zlozkou
+
+        Zapisujuci proces drzi vyhradny zamok, citajuce procesy zdielany. Bez modulu
+        fcntl (Windows) sa nezamyka, zapis cache je aj tak atomicky.
+
+        Arguments:
+            region -- skratka regionu
+
+        Keyword arguments:
+            shared -- zdielany zamok na citanie namiesto vyhradneho (default False)
+        """
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        lock_path = self._cache_path(region) + ".lock"
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_cache(self, region):
+        """Nacita data regionu z cache suboru pod zdielanym zamkom, ak cache nie je vrati None"""
+        with self._region_lock(region, shared=True):
+            return self._load_cache(region)
+
+    def _load_cache(self, region):
+        """Nacita data regionu z cache suboru
+
+        Pri formate "npy" sa stlpce len namapuju do pamate (np.load s mmap_mode="r"),
+        data sa citaju az pri pristupe a stranky zdielaju vsetky procesy. Skontroluje
+        sa velkost kazdeho stlpca, pri formate "pickle" kontrolny sucet SHA-256
+        z manifestu regionu.
+
+        Returns:
+            data regionu alebo None, ak cache neexistuje alebo je poskodena
+        """
+        if not self._cache_exists(region):
+            return None
+        with self.stats.stage("load") as counts:
+            data = self._load_cache_file(region)
+            if data is not None:
+                counts["rows"] = len(data["region"])
+                counts["bytes"] = sum(values.nbytes for values in data.values())
+        return data
+
+    def _load_cache_file(self, region):
+        """Nacita existujuci cache subor regionu pre _load_cache, poskodena cache vrati None"""
+        if self.cache_format == "npy":
+            cache_dir = self._cache_path(region)
+            try:
+                with open(os.path.join(cache_dir, "header.json"), 'r') as f:
+                    header = json.load(f)
+                data = {}
+                for column in header["columns"]:
+                    files = [column["file"]] + ([column["vocabulary"]] if "vocabulary" in column else [])
+                    for file in files:
+                        if os.path.getsize(os.path.join(cache_dir, file)) != header["nbytes"][file]:
+                            raise ValueError(f"neplatna velkost suboru {file}")
+                    data[column["name"]] = np.load(os.path.join(cache_dir, column["file"]), mmap_mode="r")
+                    if "vocabulary" in column:
+                        vocabulary = np.load(os.path.join(cache_dir, column["vocabulary"]))
+                        data[column["name"]] = EncodedColumn(data[column["name"]], vocabulary)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"WARNING: cache regionu {region} je poskodena ({e}), data sa spracuju znova", file=sys.stderr)
+                return None
+            return data
+
+        with open(self._cache_path(region), 'rb') as f:
+            compressed = f.read()
+        meta = self._load_meta(region)
+        if meta is not None and "checksum" in meta and hashlib.sha256(compressed).hexdigest() != meta["checksum"]:
+            print(f"WARNING: cache regionu {region} ma neplatny kontrolny sucet, data sa spracuju znova", file=sys.stderr)
+            return None
+        try:
+            return pickle.loads(gzip.decompress(compressed))
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            print(f"WARNING: cache regionu {region} je poskodena ({e}), data sa spracuju znova", file=sys.stderr)
+            return None
+
+    def _save_cache(self, region, data):
+        """Atomicky ulozi data regionu do cache suboru
+
+        Data sa zapisu do docasneho suboru a premenuju, citajuci proces
+        tak nikdy nevidi ciastocne zapisany subor. Pri formate "npy" sa pred
+        prepisanim stlpcov zmaze hlavicka a zapise sa az po vsetkych stlpcoch, cache
+        prerusena pocas zapisu preto nie je platna a nemoze mat stare aj nove stlpce.
+
+        Returns:
+            slovnik s informaciami pre manifest regionu (pri formate "pickle" kontrolny sucet)
+        """
+        if self.cache_format == "npy":
+            cache_dir = self._cache_path(region)
+            os.makedirs(cache_dir, exist_ok=True)
+            header_path = os.path.join(cache_dir, "header.json")
+            # stara hlavicka by po preruseni zapisu platila pre mix starych a novych stlpcov
+            if os.path.exists(header_path):
+                os.remove(header_path)
+            columns, nbytes = [], {}
+            for key, values in data.items():
+                column = {"name": key, "file": key + ".npy", "dtype": values.dtype.str}
+                if isinstance(values, EncodedColumn):
+                    # zakodovany stlpec ulozim ako kody a slovnik
+                    column["vocabulary"] = key + ".vocabulary.npy"
+                    nbytes[column["vocabulary"]] = self._save_npy(os.path.join(cache_dir, column["vocabulary"]),
+                                                                  values.vocabulary)
+                    values = values.codes
+                nbytes[column["file"]] = self._save_npy(os.path.join(cache_dir, column["file"]), values)
+                columns.append(column)
+            header = {"rows": len(data["region"]), "columns": columns, "nbytes": nbytes}
+            with open(f"{header_path}.{os.getpid()}.tmp", 'w') as f:
+                json.dump(header, f, indent=1)
+            os.replace(f"{header_path}.{os.getpid()}.tmp", header_path)
+            return {}
+
+        with self.stats.stage("pickle") as counts:
+            pickled = pickle.dumps(data)
+            counts["bytes"] = len(pickled)
+        with self.stats.stage("compress", nbytes=len(pickled)):
+            compressed = gzip.compress(pickled, compresslevel=1)
+        del pickled
+        cache_path = self._cache_path(region)
+        with self.stats.stage("write", nbytes=len(compressed)), open(f"{cache_path}.{os.getpid()}.tmp", 'wb') as f_out:
+            f_out.write(compressed)
+        os.replace(f"{cache_path}.{os.getpid()}.tmp", cache_path)
+        return {"checksum": hashlib.sha256(compressed).hexdigest()}
+
+    def _save_npy(self, path, values):
+        """Zapise pole do .npy suboru cez docasny subor, uz namapovany stary subor zostane platny
+
+        Returns:
+            velkost zapisaneho suboru v bajtoch
+        """
+        tmp_path = path[:-len(".npy")] + f".{os.getpid()}.tmp.npy"
+        with self.stats.stage("write", nbytes=values.nbytes):
+            np.save(tmp_path, values)
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    def get_dict(self, regions=None, workers=None, columns=None, filters=None):
         """Vytvori slovnik dat pre dane regiony a ulozi data do cache pamate 
         a taktiez do cache suborov ak este neexistuju
         
         Keyword arguments:
         regions -- Pre ktore regiony sa ma vytvorit slovnik a ulozit do cache (default "None") - vsetky regiony
+        workers -- Pocet procesov pre paralelne spracovanie chybajucich regionov (default "None") - jeden proces
+        columns -- Zoznam stlpcov, ktore sa vratia vo vyslednom slovniku (default "None") - vsetky stlpce
+        filters -- Slovnik stlpec: podmienka, vratia sa len riadky splnajuce vsetky podmienky (default "None").
+                   Podmienka je dvojica (od, do) vratane hranic (None = neohranicene, datumy ako
+                   "YYYY-MM-DD") alebo zoznam povolenych hodnot. Bloky, ktore podla mapy blokov
+                   v manifeste regionu nemozu vyhovovat, sa necitaju, region bez takych blokov
+                   sa vobec nenacita.
         """
         # ak je regions None -> nastavim vsetky regiony
         if regions is None:
@@ -224,46 +1672,49 @@ class DataDownloader:
             if any(region not in self.regions.keys() for region in regions):
                 print(f"ERROR: Zadany zoznam regionov obsahuje neplatny region", file=sys.stderr)
                 return
-        # vytvorenie slovnika a poli pre regiony
-        data_dict_stacked = {}
-        for i in range(len(self.headers)):
-            data_dict_stacked[self.headers[i]] = np.empty(0, dtype=self.data_types[i])
-        data_dict_stacked["region"] = np.empty(0, dtype="U3")
-        
+        # skontrolujem spravnost zadanych stlpcov
+        if columns is not None and any(column not in self.headers and column != "region" for column in columns):
+            print(f"ERROR: Zadany zoznam stlpcov obsahuje neplatny stlpec", file=sys.stderr)
+            return
+        if filters and any(column not in self.headers and column != "region" for column in filters):
+            print(f"ERROR: Filter obsahuje neplatny stlpec", file=sys.stderr)
+            return
+
+        # bloky regionov, ktore mozu vyhovovat filtru (None = region bez mapy blokov)
+        zones = {region: self._matching_zones(region, filters) for region in regions} if filters else {}
+        # regiony ulozene v zdielanej cache pamati, region bez vyhovujuceho bloku sa nenacita
+        parts = {region: self._empty_part() if zones.get(region) == [] else self._cached(region) for region in regions}
         for region in regions:
-            # ak je region ulozeny v pamati
-            if self.cached_regions[region] is not None:
-                # prechadzam kazdu hlavicku a pridavam do velkeho slovniku
-                for key in self.cached_regions[region].keys():
-                    data_dict_stacked[key] = np.append(data_dict_stacked[key], self.cached_regions[region][key])
-                continue
+            # ak region nie je ulozeny v pamati, nacitam ho z cache suboru
+            # (pri formate "npy" su stlpce len namapovane, citaju sa az pozadovane stlpce)
+            if parts[region] is None:
+                # znacku zistim pred nacitanim, subor moze po uvolneni zamku prepisat iny proces
+                stamp = self._cache_stamp(region)
+                parts[region] = self._read_cache(region)
+                if parts[region] is not None:
+                    self._remember(region, parts[region], stamp)
 
-            # ak je v cache subore
-            cache_filename = os.path.join(self.folder, self.cache_filename.replace("{}",region))
-            if os.path.exists(cache_filename):
-                # nacitam data z cache suboru
-                with gzip.open(cache_filename, 'rb') as f_out:
-                    cached_region = pickle.load(f_out)
-                # ulozim si ich do vysledneho slovnika
-                for key in cached_region.keys():
-                        data_dict_stacked[key] = np.append(data_dict_stacked[key], cached_region[key])
-                # ulozim si ich do pamate
-                self.cached_regions[region] = cached_region
-                continue
+        missing = [region for region in regions if parts[region] is None]
+        if missing:
+            # vyhradne zamky chybajucich regionov (v pevnom poradi), ostatne procesy pockaju na vysledok
+            with ExitStack() as locks:
+                for region in sorted(missing):
+                    locks.enter_context(self._region_lock(region))
+                # kym som cakal na zamok, region mohol spracovat iny proces
+                for region in missing:
+                    parts[region] = self._load_cache(region)
+                    if parts[region] is not None:
+                        self._remember(region, parts[region])
+                # zvysne regiony spracujem naraz pri jednom prechode zip suborov
+                missing = [region for region in missing if parts[region] is None]
+                if missing:
+                    parts.update(self.ingest_all(missing, workers=workers))
 
-            # region je treba nacitat s parse_region_data
-            parsed_region = self.parse_region_data(region)
-            # ulozim si ich do vysledneho slovnika
-            for key in parsed_region.keys():
-                    data_dict_stacked[key] = np.append(data_dict_stacked[key], parsed_region[key])
-            # ulozim si ich do pamate
-            self.cached_regions[region] = parsed_region
-            # ulozim si do cache suboru
-            pickled = pickle.dumps(parsed_region)
-            with gzip.open(cache_filename, 'wb', compresslevel=1) as f_out:
-                f_out.write(pickled)
-            
-        return data_dict_stacked
+        if filters:
+            parts = {region: self._filter_rows(parts[region], zones.get(region), filters, columns) for region in regions}
+
+        # pozadovane stlpce vsetkych regionov spojim naraz
+        return self._stack_chunks([parts[region] for region in regions], columns)
 
     def print_colums_info(self):
         """Na standardny vystup sa vypisu informacie o jednotlivych hlavickach
@@ -289,16 +1740,41 @@ class DataDownloader:
         for k, v in colums_info.items():
             print(f"{k}\t - {v}")
 
+def _ingest_regions(downloader, regions, chunk_rows):
+    """Spracuje regiony v samostatnom procese a vrati ich data
+
+    Arguments:
+        downloader -- DataDownloader s nastavenim zlozky a cache suborov
+        regions -- zoznam regionov na spracovanie
+        chunk_rows -- maximalny pocet riadkov v jednom bloku
+    """
+    # statistiky procesu zbieram od nuly, pripocitaju sa k statistikam volajuceho
+    downloader.stats = IngestStats(downloader.stats.trace_memory)
+    parsed = downloader.ingest_all(regions, chunk_rows)
+    return {region: (parsed[region], downloader.dropped_duplicates[region]) for region in regions}, \
+        downloader.stats.stats()
+
 # TODO vypsat zakladni informace pri spusteni python3 download.py (ne pri importu modulu)
 
 if __name__ == "__main__":
 
+    # spracovanie argumentov pomocou ArgumentParser()
+    parser = ArgumentParser()
+    parser.add_argument("--profile", action="store_true",
+                        help="Vypise cas, objem dat a spicku alokacie jednotlivych faz spracovania")
+    args = parser.parse_args()
+
     # vypisanie zakladnych informacii na vystup pri spusteni
     regions3 = ["PAK", "LBK", "KVK"]
-    dict_info = DataDownloader().get_dict(regions3)
-    pocet_zaznamov = dict_info["region"].size
-    DataDownloader().print_colums_info()
+    downloader = DataDownloader()
+    downloader.stats.trace_memory = args.profile
+    # pocet zaznamov staci precitat z manifestov regionov
+    pocet_zaznamov = sum(info["rows"] for info in downloader.summary(regions3).values())
+    downloader.print_colums_info()
     print(f"Zakladne informacie o 3 regionoch ->")
     print(f"Pocet zaznamov v ukazkovych datach = {pocet_zaznamov}")
     print(f"Regiony v ukazkovych datach = {regions3}")
     print(f"PAK -> Pardubicky kraj, LBK -> Liberecky kraj, KVK -> Karlovarsky kraj")
+    if args.profile:
+        print(f"\nProfil spracovania ->")
+        print(downloader.stats.summary())
@@ -9,7 +9,16 @@ import matplotlib.pyplot as plt
 from argparse import ArgumentParser
 from matplotlib.colors import LogNorm
 import os
-from download import DataDownloader
+from download import DataDownloader, CountCube, crosstab
+try:
+    # cache grafov (plot_cache.py z korena repozitara) je volitelne zrychlenie, bez nej sa grafy vzdy vykresluju
+    from plot_cache import FigureCache
+except ImportError:
+    FigureCache = None
+
+
+# cache grafov plot_stat (None, ak plot_cache nie je dostupny)
+figure_cache = FigureCache() if FigureCache is not None else None
 
 
 def plot_stat(data_source,
@@ -18,28 +27,30 @@ def plot_stat(data_source,
     """Funkcia vytvori graf pre 24 stlpec dat  
     
     Arguments:
-        data_srouce -- data z ktorych sa bude vykreslovat graf
+        data_srouce -- data z ktorych sa bude vykreslovat graf, slovnik numpy poli (staci "region"
+                       a "p24") alebo CountCube pre stlpec p24 (DataDownloader.count_cube("p24"))
     Keyword arguments:
         fig_location -- cesta a nazov suboru kam sa ulozi vytvoreny graf (default "None")
         show_figure -- ak zadane, zobrazi sa graf na displeji (default "False")
-    """
-    # ziskanie regionov v datach 
-    regions = np.unique(data["region"])
-    # prazdna matica pre vysledok
-    absolut = np.empty(shape=(len(regions), 6) ,dtype = 'f')
 
-    for i, region in enumerate(regions):
-        # prechadzam kazdy region a naplnim vyslednu maticu
-        indexes = np.where(data["region"] == region)
-        sums = [
-                np.sum(data["p24"][indexes] == 1),
-                np.sum(data["p24"][indexes] == 2),
-                np.sum(data["p24"][indexes] == 3),
-                np.sum(data["p24"][indexes] == 4),
-                np.sum(data["p24"][indexes] == 5),
-                np.sum(data["p24"][indexes] == 0)
-            ]
-        absolut[i] = sums
+    Ak je zadane fig_location a nie show_figure, graf sa pri rovnakych poctoch
+    nevykresli znova, ale skopiruje z figure_cache.
+    """
+    # pocty nehod pre kazdy region a upravu prednosti (v poradi riadkov grafu) jednym prechodom dat
+    if isinstance(data_source, CountCube):
+        # predpocitane pocty, regiony bez nehod vynecham ako crosstab
+        present = data_source.rollup("region")[0] > 0
+        counts, (regions, _) = data_source.select(value=[1, 2, 3, 4, 5, 0]).rollup("region", "value")
+        counts, regions = counts[present], regions[present]
+    else:
+        counts, regions, _ = crosstab(data_source, row_key="region", col_key="p24", col_labels=[1, 2, 3, 4, 5, 0])
+    # graf sa kresli len z poctov, pri rovnakych poctoch sa subor skopiruje z cache grafov
+    key = None
+    if fig_location and not show_figure and figure_cache is not None and figure_cache.enabled:
+        key = figure_cache.key(plot_stat, [counts, regions.astype(str)], {"format": os.path.splitext(fig_location)[1]})
+        if figure_cache.fetch(key, fig_location):
+            return
+    absolut = counts.astype('f')
     # uprava finalnych dat pre grafy
     absolut = np.transpose(absolut)
     relative = absolut.copy()
@@ -94,6 +105,8 @@ def plot_stat(data_source,
         if not os.path.exists(os.path.dirname(fig_location)):
             os.makedirs(os.path.dirname(fig_location))
         fig.savefig(fig_location)
+        if key:
+            figure_cache.store(key, fig_location)
     plt.close(fig)
 
 
@@ -110,5 +123,6 @@ if __name__ == "__main__":
     
     # ak nieje zadane fig location alebo 
     if args.fig_location is not None or args.show_figure is True:
-        data = DataDownloader().get_dict()
+        # graf potrebuje len pocty nehod podla regionu a p24, tie su predpocitane v manifestoch regionov
+        data = DataDownloader().count_cube("p24")
         plot_stat(data, args.fig_location, args.show_figure)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Projekt 1 do predmetu IZV
+# Autor: xhorni20@fit.vut.cz (Matej Hornik)
+
+import numpy as np
+import os
+from functools import lru_cache
+from argparse import ArgumentParser
+from zipfile import ZipFile, ZIP_DEFLATED
+from download import DataDownloader
+
+
+# retazce s diakritikou, ktore sa daju zakodovat v cp1250
+STRINGS = np.array(["", "Přerov", "Žďár nad Sázavou", "České Budějovice", "ulice Čs. armády",
+                    "Úvoz", "náměstí Míru", "Ústí nad Labem", "A:", "D1", "silnice II/150"])
+
+# rozsahy hodnot celociselnych stlpcov (ostatne maju kod 0..9)
+VALUE_RANGES = {"p36": (0, 9), "p37": (0, 9999), "p13a": (0, 3), "p13b": (0, 5), "p13c": (0, 9),
+                "p14": (0, 500000), "p24": (0, 6), "p34": (1, 5), "p44": (0, 20), "p53": (0, 99999),
+                "p5a": (1, 3)}
+
+
+@lru_cache(maxsize=None)
+def _number_strings(count, width=0):
+    """Tabulka retazcov cisel 0..count-1 doplnenych nulami na sirku width
+
+    Indexovanie tabulky je radovo rychlejsie ako astype(str) nad celym stlpcom.
+    """
+    return np.char.zfill(np.arange(count).astype(str), width)
+
+
+def _float_strings(values):
+    """Prevedie pole cisel v stotinach (|values| < 10^8) na retazce s desatinnou ciarkou (napr. -1234,05)"""
+    magnitude = np.abs(values)
+    whole = np.char.add(np.where(values < 0, "-", ""), _number_strings(10 ** 6)[magnitude // 100])
+    return np.char.add(np.char.add(whole, ","), _number_strings(100, 2)[magnitude % 100])
+
+
+def _block_columns(region_code, archive, year, start, rows, rng, duplicates=0.01, empty=0.02):
+    """Vytvori stlpce jedneho bloku CSV suboru ako zoznamy retazcov v poradi DataDownloader.headers
+
+    Arguments:
+        region_code -- kod regionu (meno CSV suboru bez pripony)
+        archive -- poradove cislo zip suboru, je sucastou p1
+        year -- rok, do ktoreho padnu datumy nehod
+        start -- poradove cislo prveho riadku bloku v CSV subore
+        rows -- pocet riadkov bloku
+        rng -- numpy generator nahodnych cisel
+
+    Keyword arguments:
+        duplicates -- podiel riadkov s uz pouzitym p1 (default 0.01)
+        empty -- podiel prazdnych buniek (default 0.02)
+    """
+    index = np.arange(start, start + rows)
+    # duplicitny riadok zopakuje p1 niektoreho predchadzajuceho riadku, cast aj z predchadzajuceho zip suboru
+    duplicate = (rng.random(rows) < duplicates) & (index > 0)
+    archives = np.full(rows, archive)
+    index[duplicate] = (rng.random(duplicate.sum()) * index[duplicate]).astype(int)
+    previous = duplicate & (rng.random(rows) < 0.5) & (archive > 0)
+    archives[previous] -= 1
+    # p1 = kod regionu (2) + cislo zip suboru (2) + poradove cislo riadku (8)
+    p1 = np.char.add(np.char.add(region_code, _number_strings(100, 2)[archives % 100]),
+                     np.char.add(_number_strings(10000, 4)[index // 10000 % 10000],
+                                 _number_strings(10000, 4)[index % 10000]))
+
+    days = rng.integers(0, 365, rows)
+    dates = np.datetime64(f"{year}-01-01") + np.arange(365)
+    columns = {"p1": p1,
+               "p2a": dates.astype(str)[days],
+               # 1.1.1970 bol stvrtok, v datach je nedela 0
+               "weekday(p2a)": _number_strings(7)[(dates.astype(int)[days] + 4) % 7],
+               "p2b": np.char.add(_number_strings(24, 2)[rng.integers(0, 24, rows)],
+                                  _number_strings(60, 2)[rng.integers(0, 60, rows)]),
+               "p47": _number_strings(100, 2)[rng.integers(0, 100, rows)]}
+    columns["p47"][rng.random(rows) < 0.05] = "XX"
+
+    for header, data_type in zip(DataDownloader.headers, DataDownloader.data_types):
+        if header in columns:
+            continue
+        if "U" in data_type:
+            columns[header] = STRINGS[rng.integers(0, STRINGS.size, rows)]
+        elif "f" in data_type:
+            columns[header] = _float_strings(rng.integers(-100000000, 100000000, rows))
+        else:
+            low, high = VALUE_RANGES.get(header, (0, 9))
+            columns[header] = _number_strings(high + 1)[rng.integers(low, high + 1, rows)]
+        if header != "p1":
+            columns[header][rng.random(rows) < empty] = ""
+    return [columns[header].tolist() for header in DataDownloader.headers]
+
+
+def generate_data(folder, rows, years=(2016, 2017, 2018, 2019, 2020), regions=None, block_rows=65536,
+                  duplicates=0.01, empty=0.02, compresslevel=1, seed=0):
+    """Vytvori zip subory s nahodnymi datami v tvare, v akom ich spracuje DataDownloader
+
+    Pre kazdy rok sa vytvori subor datagis-<rok>.zip s CSV suborom <kod>.csv pre kazdy
+    region (cp1250, oddelovac ';', hodnoty v uvodzovkach, desatinna ciarka, prazdne
+    bunky a duplicitne p1 v ramci zip suboru aj s predchadzajucim zip suborom).
+    CSV subory sa zapisuju po blokoch, v pamati je naraz najviac block_rows riadkov.
+
+    Arguments:
+        folder -- zlozka, do ktorej sa zip subory zapisu (vytvori sa)
+        rows -- celkovy pocet riadkov, rozdeli sa rovnomerne medzi zip subory a regiony
+
+    Keyword arguments:
+        years -- roky, pre kazdy sa vytvori jeden zip subor (default 2016 az 2020)
+        regions -- zoznam regionov (default "None") - vsetky regiony
+        block_rows -- pocet riadkov zapisanych naraz (default 65536)
+        duplicates -- podiel riadkov s uz pouzitym p1 (default 0.01)
+        empty -- podiel prazdnych buniek (default 0.02)
+        compresslevel -- uroven kompresie zip suborov (default 1)
+        seed -- seed generatora nahodnych cisel (default 0)
+
+    Returns:
+        zoznam mien vytvorenych zip suborov
+    """
+    if regions is None:
+        regions = list(DataDownloader.regions.keys())
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    member_rows = max(1, rows // (len(years) * len(regions)))
+
+    zip_files = []
+    for archive, year in enumerate(years):
+        zip_files.append(f"datagis-{year}.zip")
+        with ZipFile(os.path.join(folder, zip_files[-1]), 'w', ZIP_DEFLATED, compresslevel=compresslevel) as archive_file:
+            for region in regions:
+                code = DataDownloader.regions[region]
+                with archive_file.open(code + ".csv", 'w', force_zip64=True) as member:
+                    for start in range(0, member_rows, block_rows):
+                        block = _block_columns(code, archive, year, start, min(block_rows, member_rows - start),
+                                               rng, duplicates, empty)
+                        lines = ('"' + '";"'.join(row) + '"\r\n' for row in zip(*block))
+                        member.write("".join(lines).encode("cp1250"))
+    return zip_files
+
+
+if __name__ == "__main__":
+    # spracovanie argumentov pomocou ArgumentParser()
+    parser = ArgumentParser()
+    parser.add_argument("folder", help="Zlozka, do ktorej sa zapisu zip subory")
+    parser.add_argument("--rows", type=int, default=100000, help="Celkovy pocet riadkov vo vsetkych zip suboroch")
+    parser.add_argument("--years", type=int, nargs="+", default=[2016, 2017, 2018, 2019, 2020],
+                        help="Roky, pre kazdy sa vytvori jeden zip subor")
+    parser.add_argument("--duplicates", type=float, default=0.01, help="Podiel riadkov s duplicitnym p1")
+    parser.add_argument("--empty", type=float, default=0.02, help="Podiel prazdnych buniek")
+    parser.add_argument("--seed", type=int, default=0, help="Seed generatora nahodnych cisel")
+    args = parser.parse_args()
+
+    names = generate_data(args.folder, args.rows, args.years, duplicates=args.duplicates,
+                          empty=args.empty, seed=args.seed)
+    print(f"Vytvorene subory v {args.folder}: {', '.join(names)}")
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Testy download.py nad syntetickymi zip subormi zo synth_data.py
+# Spustenie: python -m pytest test (zo zlozky proj1)
+
+import os
+import sys
+import json
+import shutil
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from download import DataDownloader, EncodedColumn, crosstab
+from synth_data import generate_data
+
+REGIONS = ["JHM", "PHA"]
+YEARS = (2016, 2017, 2018, 2019)
+
+
+@pytest.fixture(scope="module")
+def archives(tmp_path_factory):
+    """Dve sady zip suborov s roznym seedom, v sade "b" maju zaznamy ine hodnoty"""
+    folders = {}
+    for name, seed in (("a", 0), ("b", 1)):
+        folders[name] = tmp_path_factory.mktemp(name)
+        generate_data(str(folders[name]), 4000, YEARS, REGIONS, duplicates=0.05, seed=seed)
+    return folders
+
+
+def _copy(source, folder, years):
+    for year in years:
+        shutil.copy(os.path.join(source, f"datagis-{year}.zip"), folder)
+
+
+def _cache_contents(folder):
+    """Data a manifesty regionov nacitane z cache suborov (nie z cache pamate)"""
+    DataDownloader.region_cache.clear()
+    downloader = DataDownloader(folder=str(folder))
+    return {region: (downloader._load_cache(region), downloader._load_meta(region)) for region in REGIONS}
+
+
+def assert_data_equal(expected, actual):
+    assert expected.keys() == actual.keys()
+    for key in expected:
+        left, right = np.asarray(expected[key]), np.asarray(actual[key])
+        assert left.dtype == right.dtype, key
+        assert np.array_equal(left, right, equal_nan=left.dtype.kind in "fmM"), key
+
+
+@pytest.mark.parametrize("scenario", ["append", "prepend", "replace", "remove", "month"])
+def test_update_cache_matches_rebuild(tmp_path, archives, scenario):
+    updated, rebuilt = tmp_path / "updated", tmp_path / "rebuilt"
+    updated.mkdir()
+    rebuilt.mkdir()
+    initial = {"append": YEARS[:-1], "prepend": YEARS[1:]}.get(scenario, YEARS)
+    _copy(archives["a"], updated, initial)
+    if scenario == "month":
+        # mesacne subory (meno je abecedne pred rocnymi) s inymi hodnotami rovnakych p1
+        shutil.copy(archives["b"] / "datagis-2018.zip", updated / "datagis-01-2020.zip")
+    DataDownloader.region_cache.clear()
+    DataDownloader(folder=str(updated)).ingest_all(REGIONS)
+
+    # zmena zip suborov po vytvoreni cache
+    if scenario in ("append", "prepend"):
+        _copy(archives["a"], updated, YEARS)
+    elif scenario == "replace":
+        _copy(archives["b"], updated, [2017])
+    elif scenario == "month":
+        shutil.copy(archives["b"] / "datagis-2019.zip", updated / "datagis-02-2020.zip")
+    else:
+        os.remove(updated / "datagis-2017.zip")
+    DataDownloader.region_cache.clear()
+    parsed = DataDownloader(folder=str(updated)).update_cache(REGIONS)
+    if scenario in ("append", "month"):
+        # novy rok alebo mesiac sa len pripoji
+        new = "datagis-02-2020.zip" if scenario == "month" else f"datagis-{YEARS[-1]}.zip"
+        assert parsed == {region: [new] for region in REGIONS}
+
+    for zip_file in os.listdir(updated):
+        if zip_file.endswith(".zip"):
+            shutil.copy(updated / zip_file, rebuilt)
+    DataDownloader.region_cache.clear()
+    DataDownloader(folder=str(rebuilt)).ingest_all(REGIONS)
+
+    expected, actual = _cache_contents(rebuilt), _cache_contents(updated)
+    for region in REGIONS:
+        assert_data_equal(expected[region][0], actual[region][0])
+        ranges = [[(a["name"], a["start"], a["stop"], a["dropped"]) for a in contents[region][1]["archives"]]
+                  for contents in (expected, actual)]
+        assert ranges[0] == ranges[1]
+
+
+@pytest.mark.parametrize("cache_format", ["pickle", "npy"])
+def test_region_cache_drops_stale_region(tmp_path, archives, cache_format):
+    _copy(archives["a"], tmp_path, YEARS)
+    DataDownloader.region_cache.clear()
+    downloader = DataDownloader(folder=str(tmp_path), cache_format=cache_format)
+    before = downloader.get_dict(["JHM"])
+    assert downloader._cached("JHM") is not None
+
+    # iny proces prepise cache subor bez zmeny cache pamate tohto procesu
+    other = DataDownloader(folder=str(tmp_path), cache_format=cache_format)
+    changed = {key: np.asarray(values)[:100] for key, values in before.items()}
+    other._save_meta("JHM", dict(other._load_meta("JHM"), **other._save_cache("JHM", changed)))
+
+    stale = DataDownloader.region_cache.stale
+    assert_data_equal(changed, downloader.get_dict(["JHM"]))
+    assert DataDownloader.region_cache.stale == stale + 1
+
+
+def test_interrupted_npy_rewrite_is_not_accepted(tmp_path, archives, monkeypatch):
+    _copy(archives["a"], tmp_path, YEARS)
+    DataDownloader.region_cache.clear()
+    downloader = DataDownloader(folder=str(tmp_path), cache_format="npy")
+    expected = {key: np.array(values) for key, values in downloader.get_dict(["JHM"]).items()}
+
+    # prepis cache sa prerusi po prvom stlpci (stlpce maju rovnaku velkost ako povodne)
+    written = []
+
+    def failing_save_npy(path, values):
+        if written:
+            raise OSError("prerusenie zapisu")
+        written.append(path)
+        return DataDownloader._save_npy(downloader, path, values[::-1])
+
+    monkeypatch.setattr(downloader, "_save_npy", failing_save_npy)
+    with pytest.raises(OSError):
+        downloader._save_cache("JHM", expected)
+    monkeypatch.undo()
+
+    DataDownloader.region_cache.clear()
+    assert not downloader._cache_exists("JHM")
+    assert_data_equal(expected, DataDownloader(folder=str(tmp_path), cache_format="npy").get_dict(["JHM"]))
+
+
+def test_profile_unzip_and_decode_have_bytes_and_rows(tmp_path, archives):
+    _copy(archives["a"], tmp_path, YEARS)
+    DataDownloader.region_cache.clear()
+    downloader = DataDownloader(folder=str(tmp_path))
+    downloader.ingest_all(["JHM"])
+    stats = downloader.stats.stats()
+    assert stats["unzip"]["rows"] == stats["decode"]["rows"] > 0
+    assert stats["unzip"]["bytes"] == stats["decode"]["bytes"] > 0
+
+
+@pytest.fixture(scope="module")
+def loaded(tmp_path_factory, archives):
+    """Zlozka so spracovanou cache regionov REGIONS s malymi blokmi mapy blokov"""
+    folder = tmp_path_factory.mktemp("loaded")
+    _copy(archives["a"], folder, YEARS)
+    DataDownloader.region_cache.clear()
+    downloader = DataDownloader(folder=str(folder))
+    downloader.zone_rows = 1000
+    downloader.ingest_all(REGIONS)
+    return folder
+
+
+def _filter_after_load(data, filters):
+    mask = np.ones(len(data["region"]), dtype=bool)
+    for column, condition in filters.items():
+        values = np.asarray(data[column])
+        if isinstance(condition, tuple):
+            low, high = (None if bound is None else np.asarray(bound, dtype=values.dtype) for bound in condition)
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+        else:
+            mask &= np.isin(values, np.asarray(condition, dtype=values.dtype))
+    return {column: np.asarray(values)[mask] for column, values in data.items()}
+
+
+@pytest.mark.parametrize("filters", [
+    {"p2a": ("2017-03-01", "2017-06-30")},
+    {"p2a": ("2018-11-15", None), "p24": [0, 4]},
+    {"p13a": (1, 2), "region": ["PHA"]},
+    {"p36": [3], "p2a": (None, "2016-02-01")},
+    {"p2a": ("2030-01-01", None)},
+])
+def test_filters_match_filtering_after_load(loaded, filters):
+    DataDownloader.region_cache.clear()
+    downloader = DataDownloader(folder=str(loaded))
+    expected = _filter_after_load(downloader.get_dict(REGIONS), filters)
+    DataDownloader.region_cache.clear()
+    assert_data_equal(expected, downloader.get_dict(REGIONS, filters=filters))
+
+
+def test_filters_skip_zones(loaded):
+    downloader = DataDownloader(folder=str(loaded))
+    filters = {"p2a": ("2017-03-01", "2017-06-30")}
+    zones = downloader._load_meta("JHM")["zones"]
+    matching = downloader._matching_zones("JHM", filters)
+    assert 0 < len(matching) < len(zones)
+
+
+def _brute_crosstab(rows, cols, row_labels, col_labels):
+    counts = np.zeros((len(row_labels), len(col_labels)), dtype=np.int64)
+    row_index = {value: i for i, value in enumerate(row_labels)}
+    col_index = {value: i for i, value in enumerate(col_labels)}
+    for row, col in zip(rows, cols):
+        if row in row_index and col in col_index:
+            counts[row_index[row], col_index[col]] += 1
+    return counts
+
+
+@pytest.mark.parametrize("row_key, col_key, row_labels, col_labels", [
+    ("region", "p24", None, None),
+    ("p24", "p36", None, None),
+    ("region", "p24", ["PHA", "STC", "JHM"], [6, 0, 2, 42]),
+    ("p47", "region", None, None),
+    ("region", "p47", ["JHM", "PHA"], ["01", "zz"]),
+    ("h", "p13a", None, [0, 1]),
+])
+@pytest.mark.parametrize("encode_strings", [False, True])
+def test_crosstab_matches_brute_force(loaded, row_key, col_key, row_labels, col_labels, encode_strings):
+    DataDownloader.region_cache.clear()
+    data = DataDownloader(folder=str(loaded), encode_strings=encode_strings).get_dict(REGIONS)
+    if encode_strings:
+        assert isinstance(data["p47"], EncodedColumn)
+    counts, rows, cols = crosstab(data, row_key, col_key, row_labels, col_labels)
+
+    row_values, col_values = np.asarray(data[row_key]).tolist(), np.asarray(data[col_key]).tolist()
+    expected_rows = sorted(set(row_values)) if row_labels is None else row_labels
+    expected_cols = sorted(set(col_values)) if col_labels is None else col_labels
+    assert rows.tolist() == expected_rows
+    assert cols.tolist() == expected_cols
+    assert np.array_equal(counts, _brute_crosstab(row_values, col_values, expected_rows, expected_cols))
+
+
+@pytest.mark.parametrize("column", DataDownloader.cube_columns)
+def test_count_cube_matches_crosstab(loaded, column):
+    DataDownloader.region_cache.clear()
+    downloader = DataDownloader(folder=str(loaded))
+    data = downloader.get_dict(REGIONS)
+    cube = downloader.count_cube(column, REGIONS)
+
+    counts, labels = cube.rollup("region", "value")
+    expected, rows, cols = crosstab(data, "region", column, labels[0], labels[1])
+    assert rows.tolist() == REGIONS
+    assert np.array_equal(counts, expected)
+    assert counts.sum() == len(data["region"])
+
+    # rez jedneho mesiaca s hodnotou, ktora v datach nie je
+    dates = data["p2a"]
+    year, month = dates.astype("M8[Y]").astype(int) + 1970, dates.astype("M8[M]").astype(int) % 12 + 1
+    values = np.concatenate([cube.labels["value"][:2], np.array([99], dtype=cube.labels["value"].dtype)])
+    sliced = cube.select(region=["PHA"], year=[2017], month=[3], value=values)
+    selected = {key: column_values[(year == 2017) & (month == 3)] for key, column_values in data.items()}
+    expected, _, _ = crosstab(selected, "region", column, ["PHA"], values)
+    assert expected.sum() > 0
+    assert np.array_equal(sliced.rollup("region", "value")[0], expected)
+    assert sliced.counts[..., -1].sum() == 0
+
+
+class _ArchiveHandler(SimpleHTTPRequestHandler):
+    """Lokalna nahrada stranky s datami, odpovede 200/304 ako http.server, volitelne aj 206 na Range"""
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        range_header = self.headers.get("Range")
+        if self.server.ranges and range_header and os.path.isfile(path) \
+                and self.headers.get("If-Range") == self.date_time_string(int(os.path.getmtime(path))):
+            with open(path, "rb") as f:
+                f.seek(int(range_header.split("=")[1].rstrip("-")))
+                body = f.read()
+            self.send_response(206)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Last-Modified", self.headers["If-Range"])
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        super().do_GET()
+
+    def log_request(self, code="-", size="-"):
+        self.server.requests.append((self.path, int(code), self.headers.get("Range")))
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(params=[True, False], ids=["ranges", "no-ranges"])
+def server(request, tmp_path, archives):
+    """HTTP server so strankou s tlacidlami a zip subormi v podzlozke data"""
+    root = tmp_path / "site"
+    (root / "data").mkdir(parents=True)
+    names = ["datagis-2016.zip", "datagis-2017.zip", "datagis-01-2018.zip", "datagis-02-2018.zip"]
+    for name, year in zip(names, (2016, 2017, 2018, 2018)):
+        shutil.copy(archives["a"] / f"datagis-{year}.zip", root / "data" / name)
+    buttons = "".join(f"<button class=\"btn btn-sm btn-primary\" onclick=\"download('data/{name}')\">{name}</button>"
+                      for name in names)
+    (root / "index.html").write_text(f"<html><body>{buttons}</body></html>")
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), partial(_ArchiveHandler, directory=str(root)))
+    httpd.ranges, httpd.requests = request.param, []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd, root / "data"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download_data_against_local_server(tmp_path, server):
+    httpd, site = server
+    folder = tmp_path / "downloaded"
+    downloader = DataDownloader(url=f"http://127.0.0.1:{httpd.server_address[1]}/", folder=str(folder))
+    expected = ["datagis-02-2018.zip", "datagis-2016.zip", "datagis-2017.zip"]
+
+    # prve spustenie stiahne rocne archivy a posledny mesiac
+    assert sorted(downloader.download_data(workers=2)) == expected
+    for name in expected:
+        assert (folder / name).read_bytes() == (site / name).read_bytes()
+    with open(folder / DataDownloader.manifest_filename) as f:
+        manifest = json.load(f)
+    assert sorted(manifest) == expected
+    for name in expected:
+        assert manifest[name]["complete"] is True
+        assert manifest[name]["size"] == os.path.getsize(site / name)
+        assert manifest[name]["last_modified"]
+    assert not any(name.endswith(".part") for name in os.listdir(folder))
+
+    # druhe spustenie nic nestiahne, server vrati 304
+    httpd.requests.clear()
+    assert downloader.download_data(workers=2) == []
+    assert sorted(code for path, code, _ in httpd.requests if path.endswith(".zip")) == [304] * 3
+
+    # prerusene stahovanie: v zlozke je len prva polovica suboru
+    name = "datagis-2017.zip"
+    content = (site / name).read_bytes()
+    os.remove(folder / name)
+    (folder / (name + ".part")).write_bytes(content[:len(content) // 2])
+    manifest[name]["complete"] = False
+    del manifest[name]["size"]
+    with open(folder / DataDownloader.manifest_filename, "w") as f:
+        json.dump(manifest, f)
+    httpd.requests.clear()
+    assert downloader.download_data(workers=2) == [name]
+    assert (folder / name).read_bytes() == content
+    assert not (folder / (name + ".part")).exists()
+    request = [entry for entry in httpd.requests if entry[0].endswith(name)]
+    # server s Range posle len zvysok suboru (206), inak sa cast suboru nahradi celym suborom (200)
+    assert request == [(f"/data/{name}", 206 if httpd.ranges else 200, f"bytes={len(content) // 2}-")]
+    with open(folder / DataDownloader.manifest_filename) as f:
+        assert json.load(f)[name] == dict(manifest[name], complete=True, size=len(content))
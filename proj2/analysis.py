@@ -7,6 +7,13 @@ import seaborn as sns
 import numpy as np
 import os
 import sys
+import json
+import functools
+try:
+    # cache grafov (plot_cache.py z korena repozitara) je volitelne zrychlenie, bez nej sa grafy vzdy vykresluju
+    from plot_cache import FigureCache
+except ImportError:
+    FigureCache = None
 
 # muzete pridat libovolnou zakladni knihovnu ci knihovnu predstavenou na prednaskach
 # dalsi knihovny pak na dotaz
@@ -25,36 +32,582 @@ Poznámka: zobrazujte na 1 desetinné místo (.1f) a počítejte, že 1 MB = 1e6
 """
 
 
-def get_dataframe(filename: str, verbose: bool = False) -> pd.DataFrame:
-    """Nacita data a prekonvertuje vhodne stlpce na kategorovy typ
+# verzia upravy dat v get_dataframe a verzia optimalizacie typov, pri zmene sa musia zvysit (zneplatnia cache)
+FRAME_VERSION = 2
+OPTIMIZER_VERSION = 1
+
+
+def _frame_key(filename: str, nullable: bool = False) -> dict:
+    """Kluc cache upraveneho ramca: cesta, velkost a cas zmeny zdrojoveho suboru a verzie upravy"""
+    stat = os.stat(filename)
+    return {"path": os.path.abspath(filename), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "version": FRAME_VERSION, "optimizer": OPTIMIZER_VERSION, "nullable": nullable}
+
+
+def _sentinel_to_na(series: pd.Series) -> pd.Series:
+    """Nahradi neznamu hodnotu -1 hodnotou <NA> v najmensom celociselnom typ s <NA> (Int8, Int16, ...)"""
+    known = pd.to_numeric(series[series != -1], downcast="integer")
+    return series.where(series != -1).astype(known.dtype.name.replace("uint", "UInt").replace("int", "Int"))
+
+
+def _dtype_candidates(series: pd.Series) -> list:
+    """Vrati mozne reprezentacie stlpca: zmenseny ciselny typ a kategoriu"""
+    candidates = []
+    if series.dtype.kind in "iu" and not isinstance(series.dtype, pd.api.extensions.ExtensionDtype):
+        candidates.append(pd.to_numeric(series, downcast="integer"))
+    elif series.dtype.kind == "f":
+        downcast = series.astype(np.float32)
+        # len bezstratove zmensenie (NaN ostane NaN)
+        if ((downcast.astype(series.dtype) == series) | series.isna()).all():
+            candidates.append(downcast)
+    if series.dtype.kind not in "bmM" and not isinstance(series.dtype, pd.CategoricalDtype):
+        candidates.append(series.astype("category"))
+    return candidates
+
+
+def optimize_dtypes(df: pd.DataFrame, exclude: tuple = ('date', 'region'), nullable: bool = False) -> tuple:
+    """Pre kazdy stlpec zvoli typ s najmensou pamatou podla jeho hodnot
+
+    Pre kazdy stlpec sa vyskusa zmenseny celociselny typ, bezstratovo zmenseny
+    float a kategoria. Ponecha sa reprezentacia s najmensou skutocnou pamatou
+    (memory_usage(deep=True)), pri rovnosti ciselny typ pred kategoriou.
+
+    Arguments:
+    df -- pandas DataFrame, stlpce sa nahradia priamo v nom
+
+    Keyword arguments:
+    exclude -- stlpce, ktore sa nemenia (default ('date', 'region'))
+    nullable -- v celociselnych stlpcoch s hodnotou -1 ju vzdy nahradit <NA> a pouzit typ Int8, Int16, ...,
+                aj ked maska <NA> zvacsi pamat stlpca, vsetky stlpce tak maju rovnaky zapis neznamej
+                hodnoty; kategoria sa potom skusa uz nad stlpcom s <NA> (default False)
+
+    Returns:
+    (df, report) -- upraveny DataFrame a zoznam {"column", "before", "after", "dtype"} s pamatou v B
+    """
+    report = []
+    for col in df:
+        before = int(df[col].memory_usage(deep=True, index=False))
+        best, best_size = df[col], before
+        if col not in exclude:
+            if nullable and best.dtype.kind in "iu" and (best == -1).any():
+                best = _sentinel_to_na(best)
+                best_size = int(best.memory_usage(deep=True, index=False))
+            for candidate in _dtype_candidates(best):
+                size = int(candidate.memory_usage(deep=True, index=False))
+                if size < best_size:
+                    best, best_size = candidate, size
+            df[col] = best
+        report.append({"column": col, "before": before, "after": best_size, "dtype": str(best.dtype)})
+    return df, report
+
+
+def _print_report(report: list):
+    """Vypise tabulku pamate stlpcov pred a po optimalizacii typov"""
+    print(f"{'column':<14} {'before MB':>10} {'after MB':>10}  dtype")
+    for row in report:
+        print(f"{row['column']:<14} {row['before'] / 1048576:>10.2f} {row['after'] / 1048576:>10.2f}  {row['dtype']}")
+
+
+def _save_frame(df: pd.DataFrame, directory: str, key: dict, sizes: dict):
+    """Ulozi upraveny ramec do zlozky, kazdy stlpec ako samostatny .npy subor
+
+    Kategoricky stlpec sa ulozi ako kody a kategorie, retazcovy ako kody a slovnik
+    retazcov s maskou chybajucich hodnot. Hlavicka s klucom sa zapisuje az nakoniec, kym nie
+    je zapisana, cache je neplatna.
+
+    Arguments:
+    df -- upraveny DataFrame (s indexom 0..n-1)
+    directory -- zlozka cache
+    key -- kluc cache z _frame_key
+    sizes -- velkosti ramca pred a po uprave pre verbose vypis
+    """
+    os.makedirs(directory, exist_ok=True)
+    header_path = os.path.join(directory, "header.json")
+    if os.path.exists(header_path):
+        os.remove(header_path)
+
+    columns = []
+    for i, col in enumerate(df):
+        series = df[col]
+        entry = {"name": col, "dtype": str(series.dtype), "file": f"{i}.npy"}
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            categories = series.cat.categories
+            entry.update(kind="category", ordered=bool(series.cat.ordered), categories=f"{i}.categories.npy",
+                         categories_dtype=str(categories.dtype))
+            values = series.cat.codes.to_numpy()
+            np.save(os.path.join(directory, entry["categories"]), _string_array(categories)[0]
+                    if categories.dtype.kind not in "biufmM" else categories.to_numpy())
+        elif isinstance(series.dtype, pd.api.extensions.ExtensionDtype) and series.dtype.kind in "iu":
+            # celociselny typ s <NA> ulozim ako hodnoty a masku chybajucich hodnot
+            entry.update(kind="nullable", missing=f"{i}.missing.npy")
+            values = series.to_numpy(dtype=series.dtype.numpy_dtype, na_value=0)
+            np.save(os.path.join(directory, entry["missing"]), series.isna().to_numpy())
+        elif series.dtype.kind in "biufmM":
+            entry["kind"] = "array"
+            values = series.to_numpy()
+        else:
+            # retazce ulozim ako kody a slovnik, pri nacitani sa kazdy rozny retazec vytvori len raz
+            entry.update(kind="string", vocabulary=f"{i}.vocabulary.npy")
+            values, missing = _string_array(series)
+            vocabulary, values = np.unique(values, return_inverse=True)
+            np.save(os.path.join(directory, entry["vocabulary"]), vocabulary)
+            if missing.any():
+                entry["missing"] = f"{i}.missing.npy"
+                np.save(os.path.join(directory, entry["missing"]), missing)
+        np.save(os.path.join(directory, entry["file"]), values)
+        columns.append(entry)
+
+    # cache moze sucasne vytvarat viac procesov, kazdy zapisuje hlavicku do vlastneho docasneho suboru
+    tmp_path = f"{header_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"key": key, "rows": len(df), "sizes": sizes, "columns": columns}, f, indent=1)
+    os.replace(tmp_path, header_path)
+
+
+def _string_array(values) -> tuple:
+    """Prevedie retazcove hodnoty na numpy pole retazcov a masku chybajucich hodnot"""
+    values = np.asarray(values, dtype=object)
+    missing = pd.isna(values)
+    if missing.any():
+        values = values.copy()
+        values[missing] = ""
+    return values.astype(str), missing
+
+
+def _read_header(directory: str, key: dict):
+    """Nacita hlavicku cache ramca, ak cache neexistuje alebo ma iny kluc vrati None"""
+    try:
+        with open(os.path.join(directory, "header.json"), "r") as f:
+            header = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return header if header["key"] == key else None
+
+
+def _open_column(directory: str, entry: dict, mmap_mode: str = None):
+    """Otvori stlpec ulozeny cez _save_frame a vrati funkciu, ktora vytvori jeho hodnoty pre zadane riadky
+
+    Kategorie a slovnik retazcov sa nacitaju raz, kody a masky sa pri mmap_mode="r"
+    citaju zo suboru az pre pozadovane riadky.
+    """
+    def load(name):
+        return np.load(os.path.join(directory, entry[name]), mmap_mode=mmap_mode)
+
+    values = load("file")
+    missing = load("missing") if "missing" in entry else None
+    if entry["kind"] == "category":
+        categories = pd.Index(np.load(os.path.join(directory, entry["categories"])), dtype=entry["categories_dtype"])
+        return lambda rows: pd.Categorical.from_codes(values[rows], categories=categories, ordered=entry["ordered"])
+    if entry["kind"] == "string":
+        vocabulary = np.load(os.path.join(directory, entry["vocabulary"])).astype(object)
+
+        def strings(rows):
+            series = pd.Series(vocabulary[values[rows]], dtype=entry["dtype"])
+            if missing is not None:
+                series[np.asarray(missing[rows])] = np.nan
+            return series.array
+        return strings
+    if entry["kind"] == "nullable":
+        return lambda rows: pd.arrays.IntegerArray(np.array(values[rows]), np.array(missing[rows]))
+    return lambda rows: np.array(values[rows])
+
+
+def _load_frame(directory: str, key: dict):
+    """Nacita ramec ulozeny cez _save_frame, ak cache neexistuje alebo ma iny kluc vrati None
+
+    Returns:
+    (df, sizes) alebo None
+    """
+    header = _read_header(directory, key)
+    if header is None:
+        return None
+    data = {entry["name"]: _open_column(directory, entry)(slice(None)) for entry in header["columns"]}
+    return pd.DataFrame(data), header["sizes"]
+
+
+def iter_dataframe(filename: str, columns: list = None, chunk_rows: int = 131072, nullable: bool = False):
+    """Postupne vracia upraveny ramec po blokoch riadkov z cache get_dataframe
+
+    Stlpce sa citaju z .npy suborov cez mmap, v pamati je naraz len jeden blok
+    vybranych stlpcov. Ak cache neexistuje alebo je neplatna, vytvori sa cez
+    get_dataframe (vtedy sa raz nacita cely ramec). Ak sa cache neda zapisat,
+    bloky sa vratia z ramca nacitaneho cez get_dataframe.
+
+    Arguments:
+    filename -- nazov suboru s datami
+
+    Keyword arguments:
+    columns -- zoznam stlpcov (default "None") - vsetky stlpce
+    chunk_rows -- pocet riadkov bloku (default 131072)
+    nullable -- ako v get_dataframe (default False)
+
+    Yields:
+    pandas DataFrame s riadkami bloku (index pokracuje cislovanim celeho ramca)
+    """
+    cache_dir = filename + ".cache"
+    key = _frame_key(filename, nullable)
+    header = _read_header(cache_dir, key)
+    if header is None:
+        df = get_dataframe(filename, nullable=nullable)
+        header = _read_header(cache_dir, key)
+        if header is None:
+            # cache sa nepodarilo zapisat, bloky vratim z nacitaneho ramca
+            if columns is not None:
+                df = df[[col for col in df.columns if col in columns]]
+            for start in range(0, len(df), chunk_rows):
+                yield df.iloc[start:start + chunk_rows]
+            return
+    entries = [entry for entry in header["columns"] if columns is None or entry["name"] in columns]
+    loaders = {entry["name"]: _open_column(cache_dir, entry, mmap_mode="r") for entry in entries}
+    for start in range(0, header["rows"], chunk_rows):
+        rows = slice(start, min(start + chunk_rows, header["rows"]))
+        yield pd.DataFrame({name: loader(rows) for name, loader in loaders.items()},
+                           index=pd.RangeIndex(rows.start, rows.stop))
+
+
+def get_dataframe(filename: str, verbose: bool = False, cache: bool = True, nullable: bool = False) -> pd.DataFrame:
+    """Nacita data a kazdemu stlpcu zvoli najmensi vhodny typ (pozri optimize_dtypes)
+
+    Stlpce date a region sa nemenia. Upraveny ramec sa ulozi do zlozky
+    <filename>.cache (stlpce ako .npy subory) a dalsie volania ho nacitaju priamo
+    z nej. Cache je platna, kym sa nezmeni cesta, velkost ani cas zmeny
+    zdrojoveho suboru, FRAME_VERSION, OPTIMIZER_VERSION a nullable. Ak sa cache
+    neda zapisat (napr. zlozka len na citanie), vypise sa varovanie a ramec sa
+    vrati bez nej.
     
     Arguments:
     filename -- nazov suboru s datami
 
     Keyword arguments:
-    verbose -- Na standardny vystup vypise informacie o velkosti ramcu pred a po uprave typov (default False)
+    verbose -- Na standardny vystup vypise informacie o velkosti ramcu pred a po uprave typov
+               a tabulku pamate jednotlivych stlpcov (default False)
+    cache -- Pouzit a vytvorit cache upraveneho ramca (default True)
+    nullable -- Neznamu hodnotu -1 v celociselnych stlpcoch vzdy nahradit <NA> (typ Int8, Int16, ...),
+                aj ked maska <NA> zvacsi pamat stlpca (default False)
 
     Returns:
     df -- pandas DataFrame s upravenymi typmi dat v urcitych stlpoch a pridanim stlpcom s datumom
     """
-    df = pd.read_pickle(filename)
+    cache_dir = filename + ".cache"
+    key = _frame_key(filename, nullable)
+    loaded = _load_frame(cache_dir, key) if cache else None
+    if loaded is not None:
+        df, sizes = loaded
+    else:
+        df = pd.read_pickle(filename)
 
-    orig_size = df.memory_usage(deep=True).sum() / 1048576
-    # pridanie noveho stlpca s datumom
-    df['date'] = pd.to_datetime(df['p2a'])
-    # zmenim typy len urcitym stlcpov
-    for col in df:
-        if col not in ['date', 'region', 'p2a', 'p13a', 'p13b', 'p13c', 'p53', 'p14', 'a', 'b', 'd', 'f', 'g', 'j', 'r', 's']:
-            df[col] = df[col].astype('category')
+        orig_size = df.memory_usage(deep=True).sum() / 1048576
+        # pridanie noveho stlpca s datumom
+        df['date'] = pd.to_datetime(df['p2a'])
+        # typy stlpcov zvoli optimalizator, region a date ostanu
+        df, report = optimize_dtypes(df, nullable=nullable)
+
+        sizes = {"orig_size": orig_size, "new_size": df.memory_usage(deep=True).sum() / 1048576, "report": report}
+        # cache ukladam len pre ramec s predvolenym indexom, index sa neuklada
+        if cache and df.index.equals(pd.RangeIndex(len(df))):
+            try:
+                _save_frame(df, cache_dir, key, sizes)
+            except OSError as e:
+                # cache je len zrychlenie, napr. v zlozke len na citanie sa ramec vrati bez nej
+                print(f"WARNING: frame cache {cache_dir} could not be written: {e}", file=sys.stderr)
 
     if verbose:
         # vypis informacie o velkosti pred a po konvertovani typov
-        new_size = df.memory_usage(deep=True).sum() / 1048576
-        print(f"orig_size={orig_size:.1f} MB\nnew_size={new_size:.1f} MB")
+        print(f"orig_size={sizes['orig_size']:.1f} MB\nnew_size={sizes['new_size']:.1f} MB")
+        _print_report(sizes["report"])
     return df
 
+# kraje, pre ktore sa vytvaraju grafy
+REGIONS = ['HKK', 'JHC', 'JHM', 'KVK']
+# pocet hodnot stlpca p21 (druh komunikacie 0..6)
+ROADTYPES = 7
+# zavinenie nehody podla p10, poradie ako kategorie z pd.cut (zoradene)
+ANIMAL_LABELS = ["jiné", "zvěří", "řidičem"]
+ANIMAL_CODES = np.array([0, 2, 2, 0, 1, 0, 0, 0, 0])
+# povetrnostne podmienky p18 1..7 (0 sa nezapocita)
+CONDITION_LABELS = ["neztížené", "mlha", "na počátku deště", "déšť", "sněžení", "náledí", "nárazový vítr"]
+CONDITION_CODES = np.array([-1, 0, 1, 2, 3, 4, 5, 6])
+# stlpce, z ktorych aggregate pocita
+AGGREGATE_COLUMNS = ['region', 'date', 'p21', 'p10', 'p18']
+
+
+def _value_codes(series: pd.Series, lookup: np.ndarray) -> np.ndarray:
+    """Prevedie hodnoty stlpca na indexy podla tabulky lookup (hodnota -> index),
+    chybajuce hodnoty a hodnoty mimo tabulky na -1"""
+    values = series.to_numpy(dtype=float, na_value=np.nan)
+    valid = (values >= 0) & (values < len(lookup))
+    codes = np.full(len(values), -1, dtype=np.intp)
+    codes[valid] = lookup[values[valid].astype(np.intp)]
+    return codes
+
+
+# periody casovych radov od najjemnejsej, pre kazdu periodu periody, na ktore sa da zhrnut
+PERIODS = ("day", "week", "month", "year")
+ROLLUPS = {"day": ("day", "week", "month", "year"), "week": ("week",), "month": ("month", "year"), "year": ("year",)}
+
+
+def period_codes(dates: np.ndarray, period: str) -> np.ndarray:
+    """Prevedie datumy (datetime64) na cele cisla period od 1.1.1970 (tyzden zacina pondelkom)
+
+    NaT nema platny kod, takeho riadky treba vynechat pred volanim (np.isnat).
+    """
+    days = dates.astype('datetime64[D]').astype(np.int64)
+    if period == "day":
+        return days
+    if period == "week":
+        # 1.1.1970 bol stvrtok, tyzden 0 zacina pondelkom 29.12.1969
+        return (days + 3) // 7
+    if period == "month":
+        return dates.astype('datetime64[M]').astype(np.int64)
+    return dates.astype('datetime64[Y]').astype(np.int64)
+
+
+def period_starts(codes: np.ndarray, period: str) -> np.ndarray:
+    """Vrati prvy den (datetime64[D]) period s kodmi z period_codes"""
+    if period == "week":
+        return (codes * 7 - 3).astype('datetime64[D]')
+    unit = {"day": "D", "month": "M", "year": "Y"}[period]
+    return codes.astype(f'datetime64[{unit}]').astype('datetime64[D]')
+
+
+class TimeSeriesCounts:
+    """Pocty nehod kraj x perioda x kategoria v suvislom rozsahu period
+
+    Vytvara sa cez from_dates jednym np.bincount nad kodmi (kraj, perioda,
+    kategoria). Jemnejsie periody sa zhrnu na hrubsie cez rollup bez noveho
+    prechodu cez riadky.
+
+    Attributes:
+    period -- perioda z PERIODS
+    regions -- zoznam krajov (os 0)
+    categories -- zoznam kategorii (os 2)
+    name -- meno stlpca kategorii
+    start -- kod prvej periody (period_codes)
+    counts -- numpy pole poctov tvaru (kraje, periody, kategorie)
+    """
+
+    def __init__(self, period: str, regions: list, categories: list, name: str, start: int, counts: np.ndarray):
+        self.period = period
+        self.regions = regions
+        self.categories = categories
+        self.name = name
+        self.start = start
+        self.counts = counts
+
+    @classmethod
+    def from_dates(cls, period: str, regions: list, categories: list, name: str,
+                   region_codes: np.ndarray, dates: np.ndarray, category_codes: np.ndarray):
+        """Spocita pocty z kodov krajov (0..), datumov a kodov kategorii (0..), riadky s NaT
+        alebo zapornym kodom sa nezapocitaju"""
+        keep = ~np.isnat(dates) & (region_codes >= 0) & (category_codes >= 0)
+        codes = period_codes(dates[keep], period)
+        start = int(codes.min()) if codes.size else 0
+        length = int(codes.max()) - start + 1 if codes.size else 0
+        shape = (len(regions), length, len(categories))
+        counts = np.bincount((region_codes[keep] * length + codes - start) * len(categories) + category_codes[keep],
+                             minlength=int(np.prod(shape))).reshape(shape)
+        return cls(period, regions, categories, name, start, counts)
+
+    @classmethod
+    def merge(cls, parts: list):
+        """Spoji pocty s rovnakou periodou, krajmi a kategoriami (napr. z blokov riadkov), rozsah period sa zjednoti"""
+        parts = [part for part in parts if part.counts.shape[1]] or parts[:1]
+        first = parts[0]
+        start = min(part.start for part in parts)
+        stop = max(part.start + part.counts.shape[1] for part in parts)
+        counts = np.zeros((len(first.regions), stop - start, len(first.categories)), dtype=np.int64)
+        for part in parts:
+            counts[:, part.start - start:part.start - start + part.counts.shape[1]] += part.counts
+        return cls(first.period, first.regions, first.categories, first.name, start, counts)
+
+    def dates(self) -> np.ndarray:
+        """Prve dni vsetkych period rady"""
+        return period_starts(np.arange(self.start, self.start + self.counts.shape[1]), self.period)
+
+    def rollup(self, period: str):
+        """Zhrnie pocty na hrubsiu periodu (napr. day -> month), vrati novy TimeSeriesCounts
+
+        Tyzden sa neda zhrnut na mesiac ani rok (tyzden moze patrit do dvoch), vtedy
+        sa vypise chyba a vrati None.
+        """
+        if period not in ROLLUPS[self.period]:
+            print(f"ERROR: period {self.period} cannot be rolled up to {period}", file=sys.stderr)
+            return
+        if period == self.period or self.counts.shape[1] == 0:
+            return TimeSeriesCounts(period, self.regions, self.categories, self.name, self.start, self.counts)
+        codes = period_codes(self.dates(), period)
+        # periody su zoradene, kazda hrubsia perioda je suvisly usek jemnejsich
+        boundaries = np.concatenate([[0], np.flatnonzero(np.diff(codes)) + 1])
+        counts = np.add.reduceat(self.counts, boundaries, axis=1)
+        return TimeSeriesCounts(period, self.regions, self.categories, self.name, int(codes[0]), counts)
+
+    def frame(self, region: str, label: str = "end") -> pd.DataFrame:
+        """Vrati pocty jedneho kraja ako DataFrame s indexom date a stlpcami kategorii
+
+        Periody pred prvou a po poslednej nehode kraja sa vynechaju, stlpce su len
+        kategorie, ktore sa vyskytuju v niektorom kraji (ako pri pd.pivot_table).
+
+        Keyword arguments:
+        label -- datum periody v indexe, "start" prvy alebo "end" posledny den periody
+                 (ako resample) (default "end")
+        """
+        counts = self.counts[self.regions.index(region)]
+        dates = self.dates()
+        if label == "end":
+            dates = np.append(dates[1:], period_starts(np.array([self.start + len(dates)]), self.period)) - 1
+        present = np.flatnonzero(counts.sum(axis=1))
+        rows = slice(present[0], present[-1] + 1) if present.size else slice(0, 0)
+        observed = self.counts.sum(axis=(0, 1)) > 0
+        columns = pd.CategoricalIndex(np.asarray(self.categories)[observed], categories=self.categories,
+                                      name=self.name)
+        return pd.DataFrame(counts[rows][:, observed], columns=columns,
+                            index=pd.DatetimeIndex(dates[rows].astype('datetime64[us]'), name='date'))
+
+    def __repr__(self):
+        return (f"TimeSeriesCounts(period={self.period}, regions={len(self.regions)}, "
+                f"periods={self.counts.shape[1]}, categories={len(self.categories)})")
+
+
+class PlotAggregates:
+    """Pocty nehod, z ktorych sa vykresluju plot_roadtype, plot_animals a plot_conditions
+
+    Pocty z roznych blokov riadkov sa daju spojit cez merge, vysledok je rovnaky
+    ako pri aggregate nad celym ramcom.
+
+    Attributes:
+    regions -- zoznam krajov
+    roadtype -- DataFrame s poctom nehod, riadky kraje a stlpce hodnoty p21 0..6
+    animal_counts -- numpy pole poctov kraj x mesiac x zavinenie (ANIMAL_LABELS) bez roku 2021
+    conditions -- TimeSeriesCounts s dennymi poctami nehod podla podmienok p18
+    """
+
+    def __init__(self, regions: list, roadtype: pd.DataFrame, animal_counts: np.ndarray,
+                 conditions: TimeSeriesCounts):
+        self.regions = regions
+        self.roadtype = roadtype
+        self.animal_counts = animal_counts
+        self.conditions = conditions
+
+    @classmethod
+    def merge(cls, parts: list):
+        """Spoji pocty vypocitane pre rozne riadky s rovnakymi krajmi"""
+        return cls(parts[0].regions, sum(part.roadtype for part in parts),
+                   sum(part.animal_counts for part in parts),
+                   TimeSeriesCounts.merge([part.conditions for part in parts]))
+
+    @property
+    def animals(self) -> pd.DataFrame:
+        """DataFrame so stlpcami region, Měsíc, p10 a count, len nenulove pocty"""
+        region, month, cause = np.nonzero(self.animal_counts)
+        return pd.DataFrame({'region': np.asarray(self.regions)[region], 'Měsíc': month + 1,
+                             'p10': pd.Categorical.from_codes(cause, categories=ANIMAL_LABELS),
+                             'count': self.animal_counts[region, month, cause]})
+
+    def __repr__(self):
+        return (f"PlotAggregates(regions={self.regions}, roadtype={self.roadtype.shape}, "
+                f"animal_counts={self.animal_counts.shape}, conditions={self.conditions})")
+
+
+def aggregate(df: pd.DataFrame, regions: list = REGIONS) -> PlotAggregates:
+    """Spocita vsetky pocty nehod potrebne pre grafy jednym prechodom cez ramec
+
+    Riadky krajov sa vyberu raz, kazda tabulka je potom jeden np.bincount nad
+    kodmi (kraj, hodnota). Grafy sa potom vykresluju z malych tabuliek.
+
+    Arguments:
+    df -- pandas DataFrame z get_dataframe
+
+    Keyword arguments:
+    regions -- kraje, pre ktore sa pocty spocitaju (default REGIONS)
+
+    Returns:
+    PlotAggregates
+    """
+    region_codes = pd.Categorical(df['region'], categories=regions).codes.astype(np.intp)
+    selected = np.flatnonzero(region_codes >= 0)
+    region_codes = region_codes[selected]
+    days = df['date'].to_numpy()[selected].astype('datetime64[D]')
+    dated = ~np.isnat(days)
+    n = len(regions)
+
+    # druhy komunikacie: kraj x p21
+    road = _value_codes(df['p21'].iloc[selected], np.arange(ROADTYPES))
+    keep = road >= 0
+    counts = np.bincount(region_codes[keep] * ROADTYPES + road[keep], minlength=n * ROADTYPES)
+    roadtype = pd.DataFrame(counts.reshape(n, ROADTYPES), index=pd.Index(regions, name='region'))
+
+    # zavinenie: kraj x mesiac x p10, bez roku 2021
+    cause = _value_codes(df['p10'].iloc[selected], ANIMAL_CODES)
+    months = days.astype('datetime64[M]').astype(np.int64)
+    keep = dated & (cause >= 0) & (months // 12 + 1970 != 2021)
+    animals = np.bincount((region_codes[keep] * 12 + months[keep] % 12) * len(ANIMAL_LABELS) + cause[keep],
+                          minlength=n * 12 * len(ANIMAL_LABELS)).reshape(n, 12, len(ANIMAL_LABELS))
+
+    # podmienky: kraj x den x p18, na mesiace a roky sa zhrnu cez rollup
+    condition = _value_codes(df['p18'].iloc[selected], CONDITION_CODES)
+    conditions = TimeSeriesCounts.from_dates("day", regions, CONDITION_LABELS, 'p18', region_codes, days, condition)
+
+    return PlotAggregates(regions, roadtype, animals, conditions)
+
+
+def aggregate_chunks(filename: str, regions: list = REGIONS, chunk_rows: int = 131072) -> PlotAggregates:
+    """Spocita pocty pre grafy po blokoch riadkov z iter_dataframe, cely ramec sa nenacita
+
+    Pocty kazdeho bloku sa hned pripocitaju k doterajsim, pamat je obmedzena
+    velkostou bloku. Grafy z vysledku su rovnake ako z aggregate(get_dataframe(filename)).
+
+    Arguments:
+    filename -- nazov suboru s datami
+
+    Keyword arguments:
+    regions -- kraje, pre ktore sa pocty spocitaju (default REGIONS)
+    chunk_rows -- pocet riadkov bloku (default 131072)
+
+    Returns:
+    PlotAggregates
+    """
+    total = None
+    for chunk in iter_dataframe(filename, columns=AGGREGATE_COLUMNS, chunk_rows=chunk_rows):
+        part = aggregate(chunk, regions)
+        total = part if total is None else PlotAggregates.merge([total, part])
+    return total
+
+
+# cache grafov plot_* funkcii (None, ak plot_cache nie je dostupny)
+figure_cache = FigureCache() if FigureCache is not None else None
+# pomocne funkcie a kniznice, z ktorych plot_* funkcie kreslia, ich zmena zneplatni grafy v cache
+FIGURE_DEPENDENCIES = [TimeSeriesCounts.frame, TimeSeriesCounts.rollup, TimeSeriesCounts.dates, period_codes,
+                       period_starts, PlotAggregates.animals.fget, sns.__version__, pd.__version__]
+
+
+def _cached_figure(inputs):
+    """Dekorator plot_* funkcie: graf sa nevykresli, ak je v figure_cache
+
+    Funkcia dostane vzdy PlotAggregates. Cache sa nepouzije pri show_figure,
+    bez fig_location, bez plot_cache alebo pri figure_cache.enabled = False.
+
+    Arguments:
+    inputs -- funkcia, ktora z PlotAggregates vrati zoznam poctov, z ktorych sa graf kresli
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(df, fig_location: str = None, show_figure: bool = False):
+            aggregates = df if isinstance(df, PlotAggregates) else aggregate(df)
+            if show_figure or not fig_location or figure_cache is None or not figure_cache.enabled:
+                return function(aggregates, fig_location, show_figure)
+            key = figure_cache.key(function, inputs(aggregates), {"format": os.path.splitext(fig_location)[1]},
+                                   FIGURE_DEPENDENCIES)
+            if figure_cache.fetch(key, fig_location):
+                return
+            function(aggregates, fig_location, show_figure)
+            figure_cache.store(key, fig_location)
+        return wrapper
+    return decorator
+
+
 # Ukol 2: počty nehod v jednotlivých regionech podle druhu silnic
 
+@_cached_figure(lambda aggregates: [aggregates.regions, aggregates.roadtype])
 def plot_roadtype(df: pd.DataFrame, fig_location: str = None,
                   show_figure: bool = False):
     """Funkcia vytvori graf so 6 podgrafmi s nehodami v 4 krajoch podla typu silnicnej komunikacie
@@ -62,15 +615,14 @@ def plot_roadtype(df: pd.DataFrame, fig_location: str = None,
     V pripade zadaneho argumentu show_figure, sa graf zobrazi 
 
     Arguments:
-    df -- Pandas DataFrame, data z ktoreho sa vytvoria grafy
+    df -- Pandas DataFrame alebo PlotAggregates z aggregate(df), data z ktoreho sa vytvoria grafy
 
     Keyword Arguments:
     fig_location -- Nazov suboru, do ktoreho sa ulozi vysledny graf(default None)
     show_figure -- Graf sa zobrazi na obrazovke pri hodnote True(default False)
     """
 
-    kraje = ['HKK', 'JHC', 'JHM', 'KVK']
-    df = df.loc[df['region'].isin(kraje)]
+    aggregates = df if isinstance(df, PlotAggregates) else aggregate(df)
     titles = ['Dvoupruhová komunikace', 'Třípruhová komunika', 'Čtyřpruhová komunikace',
               'Vícepruhová komunikace', 'Rychlostní komunikace', 'Jiná komunikace']
     # nastavenie grafu
@@ -85,12 +637,13 @@ def plot_roadtype(df: pd.DataFrame, fig_location: str = None,
     for i in range(6):
         # ziskanie dat pre jednotlive druhy komunikacie
         index = 0 if index == 7 else index # ak sa jedna o posledny graf tak to je 0 v stlpci p21
-        data = df.loc[df['p21'] == index].groupby('region')['p21'].count()
+        data = aggregates.roadtype[index]
         if index == 3:
             # ctyrpruhova komunikace je v 2 stlpoch tak ich spocitam spolu
-            data = data + df.loc[df['p21'] == index + 1].groupby('region')['p21'].count()
+            data = data + aggregates.roadtype[index + 1]
             index += 1
-        
+        data = data.loc[data > 0]
+
         sns.barplot(ax=ax[i], x=data.index, y=data.values, 
                     palette=['blue', 'orange', 'green', 'red'], ).set_title(titles[i])
         index += 1
@@ -107,6 +660,7 @@ def plot_roadtype(df: pd.DataFrame, fig_location: str = None,
     plt.close(fig)
 
 # Ukol3: zavinění zvěří
+@_cached_figure(lambda aggregates: [aggregates.regions, aggregates.animal_counts])
 def plot_animals(df: pd.DataFrame, fig_location: str = None,
                  show_figure: bool = False):
     """Funkcia vytvori graf so 4 podgrafmi, ktore zobrazia pocet nehod v jednotlivych mesiacoch rozdelenych 
@@ -115,31 +669,26 @@ def plot_animals(df: pd.DataFrame, fig_location: str = None,
     V pripade zadaneho argumentu show_figure, sa graf zobrazi 
 
     Arguments:
-    df -- Pandas DataFrame, data z ktoreho sa vytvoria grafy
+    df -- Pandas DataFrame alebo PlotAggregates z aggregate(df), data z ktoreho sa vytvoria grafy
 
     Keyword Arguments:
     fig_location -- Nazov suboru, do ktoreho sa ulozi vysledny graf(default None)
     show_figure -- Graf sa zobrazi na obrazovke pri hodnote True(default False)
     """
 
-    kraje = ['HKK', 'JHC', 'JHM', 'KVK']
-    df = df.loc[df['region'].isin(kraje)]
+    aggregates = df if isinstance(df, PlotAggregates) else aggregate(df)
+    kraje = aggregates.regions
+    animals = aggregates.animals
     # nastavenie grafu
     sns.set(rc={'axes.facecolor': '#eaeaf2'})
     fig, axes = plt.subplots(2, 2, figsize=(11.69, 8.27))
     fig.suptitle("Nehody v mesiacoch")    
     ax = axes.flat
-    pd.options.mode.chained_assignment = None
-
-    # konvertovanie stlpca p10 na retazce 
-    df['p10'] = pd.cut(df['p10'], bins=[0, 1, 3, 4, 5, 9], labels=["jiné", "řidičem", "jiné", "zvěří", "jiné"], 
-                       right=False, ordered=False)
-    # odfiltrovanie roku 2021 a ziskanie mesiacov 
-    df = df[df['date'].dt.year != 2021]
-    df['Měsíc'] = df['date'].dt.month
-    # vytvorenie 4 podgrafov
+
+    # vytvorenie 4 podgrafov z poctov nehod (mesiac x zavinenie, bez roku 2021)
     for i in range(4):
-        axplt = sns.countplot(x="Měsíc", hue="p10", data=df.loc[df['region'] == kraje[i]], ax=ax[i])
+        axplt = sns.barplot(x="Měsíc", y="count", hue="p10", data=animals.loc[animals['region'] == kraje[i]],
+                            errorbar=None, ax=ax[i])
         axplt.legend_.remove()
         axplt.set_title(f"Kraj: {kraje[i]}")
     
@@ -158,6 +707,8 @@ def plot_animals(df: pd.DataFrame, fig_location: str = None,
     plt.close(fig)
 
 # Ukol 4: Povětrnostní podmínky
+@_cached_figure(lambda aggregates: [aggregates.regions, aggregates.conditions.period, aggregates.conditions.start,
+                                    aggregates.conditions.categories, aggregates.conditions.counts])
 def plot_conditions(df: pd.DataFrame, fig_location: str = None,
                     show_figure: bool = False):
     """Funkcia vytvori graf so 4 podgrafmi, ktore zobrazia pocet nehod v od zaciatku 2016 do konca 2020.
@@ -166,15 +717,14 @@ def plot_conditions(df: pd.DataFrame, fig_location: str = None,
     V pripade zadaneho argumentu show_figure, sa graf zobrazi 
 
     Arguments:
-    df -- Pandas DataFrame, data z ktoreho sa vytvoria grafy
+    df -- Pandas DataFrame alebo PlotAggregates z aggregate(df), data z ktoreho sa vytvoria grafy
 
     Keyword Arguments:
     fig_location -- Nazov suboru, do ktoreho sa ulozi vysledny graf(default None)
     show_figure -- Graf sa zobrazi na obrazovke pri hodnote True(default False)
     """
-    # vybrate kraje, pre ktore sa zobrazia data
-    kraje = ['HKK', 'JHC', 'JHM', 'KVK']
-    df = df.loc[df['region'].isin(kraje)]
+    aggregates = df if isinstance(df, PlotAggregates) else aggregate(df)
+    kraje = aggregates.regions
     
     # nastavenie grafu
     sns.set(rc={'axes.facecolor': '#eaeaf2'})
@@ -182,18 +732,10 @@ def plot_conditions(df: pd.DataFrame, fig_location: str = None,
     fig.suptitle("Povětrnostní podmínky")
     ax = axes.flat
 
-    # odmazanie dat ktore mali stlpec p18 v 0
-    df = df.loc[df['p18'] != 0]
-    # nastavenie retazcom za hodnoty v stlpci p18
-    labels = ["neztížené", "mlha", "na počátku deště", "déšť", "sněžení", "náledí", "nárazový vítr"]
-    df['p18'] = pd.cut(df['p18'], bins=[1, 2, 3, 4, 5, 6, 7, 8], labels=labels, 
-                       right=False)
-    # v pre kazdy den a kraj v stlpci pocet nehod pre rozne podmienky
-    df_pivot = pd.pivot_table(df, columns="p18", values="p1", index=["region", "date"], aggfunc="count").reset_index()
-
+    # denne pocty nehod zhrniem na mesiace naraz pre vsetky kraje
+    monthly = aggregates.conditions.rollup("month")
     for i in range(4):
-        # vyberem data len pre 1 region a podvzorkujem data na uroven mesiacov
-        data = (df_pivot.loc[df_pivot['region'] == kraje[i]]).groupby('date').agg('sum').resample('M').sum().reset_index()
+        data = monthly.frame(kraje[i]).reset_index()
         # dam prec data z roku 2021 
         data = data.loc[data['date'].dt.year != 2021]
         # vytvorenie grafu
@@ -220,6 +762,8 @@ if __name__ == "__main__":
     # skript nebude pri testovani pousten primo, ale budou volany konkreni ¨
     # funkce.
     df = get_dataframe("data/accidents.pkl.gz", verbose=True) # tento soubor si stahnete sami, při testování pro hodnocení bude existovat
-    plot_roadtype(df, "data/01_road.png",show_figure=True)
-    plot_animals(df, "data/02_animals.png", True)
-    plot_conditions(df, "data/03_conditions.png", True)
+    # pocty pre vsetky grafy sa spocitaju raz
+    aggregates = aggregate(df)
+    plot_roadtype(aggregates, "data/01_road.png",show_figure=True)
+    plot_animals(aggregates, "data/02_animals.png", True)
+    plot_conditions(aggregates, "data/03_conditions.png", True)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3.9
+# coding=utf-8
+import os
+import sys
+import matplotlib
+import pandas as pd
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+# grafy sa len ukladaju, nie zobrazuju (nastavi sa aj v kazdom procese pri importe modulu)
+matplotlib.use("Agg")
+# koren repozitara s plot_cache.py, grafy sa tak beru z cache grafov
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import analysis
+
+# zlozka projektu 3 s geo.py
+GEO_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "proj3")
+# stlpce, ktore potrebuju geo.make_geo, geo.plot_geo a geo.plot_cluster
+GEO_COLUMNS = ['p1', 'p2a', 'p36', 'd', 'e', 'region']
+
+# data procesu: nastavenia z _init_worker a data nacitane jednotlivymi loadermi
+_worker_data = {}
+
+
+def aggregates_loader(filename: str, chunk_rows: int) -> analysis.PlotAggregates:
+    """Pocty pre analysis.plot_* spocitane po blokoch z cache get_dataframe"""
+    return analysis.aggregate_chunks(filename, chunk_rows=chunk_rows)
+
+
+def geo_loader(filename: str, chunk_rows: int):
+    """GeoDataFrame pre geo.plot_geo a geo.plot_cluster len z potrebnych stlpcov cache get_dataframe"""
+    import geo
+    df = pd.concat(analysis.iter_dataframe(filename, columns=GEO_COLUMNS, chunk_rows=chunk_rows))
+    # make_geo testuje suradnice cez np.isnan
+    df[['d', 'e']] = df[['d', 'e']].astype(float)
+    return geo.make_geo(df)
+
+
+def _init_worker(filename: str, chunk_rows: int):
+    """Nastavi proces, data sa nacitaju az pri prvom grafe, ktory ich potrebuje
+
+    Stlpce sa citaju len na citanie z .npy suborov cache get_dataframe cez mmap,
+    stranky suborov zdielaju vsetky procesy cez cache operacneho systemu, ramec sa
+    medzi procesmi neposiela.
+    """
+    matplotlib.use("Agg")
+    _worker_data["source"] = (filename, chunk_rows)
+
+
+def _render(function, fig_location: str, options: dict, loader) -> tuple:
+    """Vykresli jeden graf v procese a vrati (cas v sekundach, ci sa graf skopiroval z cache grafov)"""
+    if loader not in _worker_data:
+        _worker_data[loader] = loader(*_worker_data["source"])
+    # cache grafov modulu funkcie (analysis.figure_cache, geo.figure_cache)
+    cache = getattr(sys.modules[function.__module__], "figure_cache", None)
+    hits = cache.hits if cache else 0
+    start = perf_counter()
+    function(_worker_data[loader], fig_location, **options)
+    return perf_counter() - start, bool(cache) and cache.hits > hits
+
+
+def run_report(filename: str, jobs: list, workers: int = None, chunk_rows: int = 131072) -> dict:
+    """Vykresli grafy paralelne v procesoch s backendom Agg
+
+    Pred spustenim procesov sa overi (pripadne vytvori) cache get_dataframe. Kazdy
+    proces si z nej raz nacita data loadera (napr. pocty cez analysis.aggregate_chunks)
+    a vykresluje z nich vsetky svoje grafy s tym loaderom. Chyba jedneho grafu sa
+    vypise a ostatne grafy sa vykreslia.
+
+    Arguments:
+    filename -- nazov suboru s datami
+    jobs -- zoznam (funkcia, fig_location, options) alebo (funkcia, fig_location, options, loader),
+            funkcia sa vola ako funkcia(loader(filename, chunk_rows), fig_location, **options),
+            napr. (analysis.plot_roadtype, "01_road.png", {}) alebo
+            (geo.plot_geo, "geo1.png", {}, geo_loader) (default loader aggregates_loader)
+
+    Keyword arguments:
+    workers -- pocet procesov (default "None") - pocet grafov, najviac pocet procesorov
+    chunk_rows -- pocet riadkov bloku pri citani cache (default 131072)
+
+    Returns:
+    slovnik fig_location: (cas vykreslenia v sekundach, ci sa graf skopiroval z cache grafov)
+    (len uspesne grafy)
+    """
+    if not jobs:
+        return {}
+    # cache sa vytvori raz v hlavnom procese, nie sucasne v kazdom procese
+    if next(analysis.iter_dataframe(filename, columns=[], chunk_rows=1), None) is None:
+        return {}
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+
+    times = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(filename, chunk_rows)) as executor:
+        futures = {job[1]: executor.submit(_render, *job[:3], job[3] if len(job) > 3 else aggregates_loader)
+                   for job in jobs}
+        for fig_location, future in futures.items():
+            try:
+                times[fig_location] = future.result()
+            except Exception as e:
+                print(f"ERROR: figure {fig_location} failed: {e}", file=sys.stderr)
+    return times
+
+
+if __name__ == "__main__":
+    # spracovanie argumentov pomocou ArgumentParser()
+    parser = ArgumentParser()
+    parser.add_argument("--filename", default="data/accidents.pkl.gz", help="Subor s datami")
+    parser.add_argument("--folder", default="data", help="Zlozka, do ktorej sa grafy ulozia")
+    parser.add_argument("--workers", type=int, help="Pocet procesov")
+    parser.add_argument("--geo", action="store_true", help="Vykreslit aj grafy geo.py z projektu 3")
+    args = parser.parse_args()
+
+    report_jobs = [(analysis.plot_roadtype, os.path.join(args.folder, "01_road.png"), {}),
+                   (analysis.plot_animals, os.path.join(args.folder, "02_animals.png"), {}),
+                   (analysis.plot_conditions, os.path.join(args.folder, "03_conditions.png"), {})]
+    if args.geo:
+        sys.path.append(GEO_FOLDER)
+        import geo
+        report_jobs += [(geo.plot_geo, os.path.join(args.folder, "geo1.png"), {}, geo_loader),
+                        (geo.plot_cluster, os.path.join(args.folder, "geo2.png"), {}, geo_loader)]
+    start = perf_counter()
+    report_times = run_report(args.filename, report_jobs, args.workers)
+    for location, (seconds, cached) in report_times.items():
+        print(f"{location:<30} {seconds:>7.2f} s{' (cache)' if cached else ''}")
+    print(f"{'spolu':<30} {perf_counter() - start:>7.2f} s")
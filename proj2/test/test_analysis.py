@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# Testy analysis.py nad nahodnymi datami
+# Spustenie: python -m pytest test (zo zlozky proj2)
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+import shutil
+import subprocess
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from analysis import TimeSeriesCounts, get_dataframe, iter_dataframe
+
+REGIONS = ["JHM", "PHA", "STC"]
+CATEGORIES = ["sucho", "dazd", "sneh", "hmla"]
+# frekvencie resample s oznacenim posledneho dna periody, tyzden konci v nedelu
+FREQUENCIES = {"week": "W-SUN", "month": "ME", "year": "YE"}
+
+
+@pytest.fixture(scope="module")
+def rows():
+    """Nahodne nehody s datumami 2015-2021 vratane NaT a chybajucich kodov, kraj STC bez nehod"""
+    rng = np.random.default_rng(0)
+    size = 20000
+    dates = np.datetime64("2015-03-04") + rng.integers(0, 2400, size).astype("timedelta64[D]")
+    dates[rng.random(size) < 0.01] = np.datetime64("NaT")
+    region_codes = rng.integers(0, 2, size)
+    # posledna kategoria sa nevyskytuje, -1 je neznama kategoria
+    category_codes = rng.integers(-1, len(CATEGORIES) - 1, size)
+    return region_codes, dates, category_codes
+
+
+def _resampled(rows, region, period):
+    """Pocty kraja cez pandas resample priamo z riadkov"""
+    region_codes, dates, category_codes = rows
+    keep = (region_codes == REGIONS.index(region)) & ~np.isnat(dates) & (category_codes >= 0)
+    df = pd.DataFrame({"date": dates[keep].astype("datetime64[us]"),
+                       "category": np.asarray(CATEGORIES)[category_codes[keep]]})
+    return pd.crosstab(df["date"], df["category"]).resample(FREQUENCIES[period]).sum()
+
+
+@pytest.mark.parametrize("source, period", [("day", "week"), ("day", "month"), ("day", "year"),
+                                            ("month", "year")])
+def test_rollup_matches_resample(rows, source, period):
+    counts = TimeSeriesCounts.from_dates(source, REGIONS, CATEGORIES, "category", *rows).rollup(period)
+    assert counts.period == period
+
+    # kategoria "hmla" sa v datach nevyskytuje
+    observed = CATEGORIES[:-1]
+    for region in REGIONS[:2]:
+        frame = counts.frame(region)
+        expected = _resampled(rows, region, period).reindex(columns=observed, fill_value=0)
+        assert list(frame.columns) == observed
+        assert np.array_equal(frame.index.values, expected.index.values)
+        assert np.array_equal(frame.to_numpy(), expected.to_numpy())
+    assert counts.frame("STC").empty
+
+
+@pytest.mark.parametrize("source, period", [("day", "week"), ("day", "month"), ("day", "year"),
+                                            ("month", "year")])
+def test_rollup_matches_direct_counts(rows, source, period):
+    rolled = TimeSeriesCounts.from_dates(source, REGIONS, CATEGORIES, "category", *rows).rollup(period)
+    direct = TimeSeriesCounts.from_dates(period, REGIONS, CATEGORIES, "category", *rows)
+    assert rolled.start == direct.start
+    assert np.array_equal(rolled.counts, direct.counts)
+
+
+@pytest.mark.parametrize("period", ["month", "year"])
+def test_week_cannot_roll_up(rows, period):
+    assert TimeSeriesCounts.from_dates("week", REGIONS, CATEGORIES, "category", *rows).rollup(period) is None
+
+
+@pytest.fixture
+def accidents(tmp_path):
+    """Maly subor nehod vo formate accidents.pkl.gz"""
+    rng = np.random.default_rng(0)
+    size = 500
+    df = pd.DataFrame({"p1": np.arange(size), "p2a": pd.Series(pd.date_range("2016-01-01", periods=size)).astype(str),
+                       "p21": rng.integers(-1, 7, size), "p13a": rng.integers(0, 3, size).astype(float),
+                       "region": rng.choice(REGIONS, size)})
+    filename = str(tmp_path / "accidents.pkl.gz")
+    df.to_pickle(filename)
+    return filename
+
+
+def test_get_dataframe_without_writable_cache(accidents, capsys):
+    # na mieste zlozky cache je subor, zapis cache zlyha (aj pod rootom, ktory ignoruje prava)
+    with open(accidents + ".cache", "w") as f:
+        f.write("")
+    expected = get_dataframe(accidents, cache=False)
+
+    df = get_dataframe(accidents)
+    assert "WARNING: frame cache" in capsys.readouterr().err
+    pd.testing.assert_frame_equal(df, expected)
+    chunks = list(iter_dataframe(accidents, columns=["p21", "date"], chunk_rows=128))
+    assert [len(chunk) for chunk in chunks] == [128, 128, 128, 116]
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected[["p21", "date"]])
+
+
+def test_analysis_imports_without_plot_cache(tmp_path):
+    # odovzdavany subor sam v prazdnej zlozke, cache grafov sa vypne
+    shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "analysis.py"), tmp_path)
+    env = {key: value for key, value in os.environ.items() if key != "PYTHONPATH"}
+    result = subprocess.run([sys.executable, "-c", "import analysis; print(analysis.figure_cache)"],
+                            cwd=tmp_path, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "None"
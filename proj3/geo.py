@@ -7,7 +7,29 @@ import contextily
 import sklearn.cluster
 import numpy as np
 from mpl_toolkits.axes_grid1 import make_axes_locatable
+import os
 # muzete pridat vlastni knihovny
+try:
+    # cache grafov (plot_cache.py z korena repozitara) je volitelne zrychlenie, bez nej sa grafy vzdy vykresluju
+    from plot_cache import FigureCache
+except ImportError:
+    FigureCache = None
+
+
+# cache grafov plot_geo a plot_cluster (None, ak plot_cache nie je dostupny)
+figure_cache = FigureCache() if FigureCache is not None else None
+# kniznica, ktora graf kresli, jej zmena zneplatni grafy v cache
+FIGURE_DEPENDENCIES = [geopandas.__version__]
+
+
+def _use_cache(fig_location: str, show_figure: bool) -> bool:
+    """Cache sa pouzije len pri ulozeni grafu do suboru bez zobrazenia"""
+    return bool(fig_location) and not show_figure and figure_cache is not None and figure_cache.enabled
+
+
+def _figure_params(fig_location: str) -> dict:
+    """Parametre kluca grafu v cache"""
+    return {"format": os.path.splitext(fig_location)[1]}
 
 
 def make_geo(df: pd.DataFrame) -> geopandas.GeoDataFrame:
@@ -49,11 +71,22 @@ def plot_geo(gdf: geopandas.GeoDataFrame, fig_location: str = None,
     # vyfiltrovanie dat pre 1 kraj
     kraj = "JHM"
     gdf = gdf[gdf["region"] == kraj]
+    years = [2018, 2019, 2020]
+    colors = ["green", "red"]
+
+    # graf sa kresli len z bodov vykreslenych nehod, pri rovnakych bodoch sa skopiruje z cache grafov
+    key = None
+    if _use_cache(fig_location, show_figure):
+        drawn = gdf[gdf['date'].dt.year.isin(years) & gdf["p36"].isin([0, 1])]
+        key = figure_cache.key(plot_geo, [drawn.geometry.x.to_numpy(), drawn.geometry.y.to_numpy(),
+                                          drawn['date'].dt.year.to_numpy(), drawn["p36"].to_numpy()],
+                               _figure_params(fig_location), FIGURE_DEPENDENCIES)
+        if figure_cache.fetch(key, fig_location):
+            return
+
     # nastavenie grafu
     fig, axes = plt.subplots(3, 2, figsize=(15, 20))
     ax = axes.flat
-    years = [2018, 2019, 2020]
-    colors = ["green", "red"]
 
     # generovanie grafov
     for i in range(3):
@@ -83,6 +116,8 @@ def plot_geo(gdf: geopandas.GeoDataFrame, fig_location: str = None,
     # ulozenie grafu do suboru
     if fig_location:
         plt.savefig(fig_location)
+        if key:
+            figure_cache.store(key, fig_location)
     # zobrazenie grafu
     if show_figure:
         plt.show()
@@ -106,6 +141,14 @@ def plot_cluster(gdf: geopandas.GeoDataFrame, fig_location: str = None,
     kraj = "JHM"
     gdf = gdf[gdf["region"] == kraj]
     gdf = gdf[gdf["p36"] == 1]
+    coords = np.dstack([gdf.geometry.x, gdf.geometry.y]).reshape(-1, 2)
+
+    # pri rovnakych suradniciach nehod sa graf skopiruje z cache grafov (vratane jedneho nahodneho zhlukovania)
+    key = None
+    if _use_cache(fig_location, show_figure):
+        key = figure_cache.key(plot_cluster, [coords], _figure_params(fig_location), FIGURE_DEPENDENCIES)
+        if figure_cache.fetch(key, fig_location):
+            return
 
     plt.figure(figsize=(15, 20))
     ax = plt.gca()
@@ -113,7 +156,6 @@ def plot_cluster(gdf: geopandas.GeoDataFrame, fig_location: str = None,
     ax.axis('off')
 
     # vytvorenie clusteru
-    coords = np.dstack([gdf.geometry.x, gdf.geometry.y]).reshape(-1, 2)
     # pouzitych 25 clusterov TODO
     db = sklearn.cluster.MiniBatchKMeans(n_clusters=25).fit(coords)
 
@@ -137,6 +179,8 @@ def plot_cluster(gdf: geopandas.GeoDataFrame, fig_location: str = None,
     # ulozenie grafu do suboru
     if fig_location:
         plt.savefig(fig_location)
+        if key:
+            figure_cache.store(key, fig_location)
     # zobrazenie grafu
     if show_figure:
         plt.show()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Testy plot_cache.py
+# Spustenie: python -m pytest test (z korena repozitara)
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from plot_cache import FigureCache
+
+
+def _draw(path, size):
+    """Nahrada vykreslenia grafu: subor danej velkosti"""
+    with open(path, "wb") as f:
+        f.write(bytes(size))
+
+
+def test_figure_cache_evicts_least_recently_used(tmp_path):
+    cache = FigureCache(directory=str(tmp_path / "cache"), max_bytes=2500, max_age=None)
+    figure = str(tmp_path / "figure.png")
+    for i, key in enumerate(["a", "b"]):
+        _draw(figure, 1000)
+        cache.store(key, figure)
+        os.utime(cache.path(key, figure), (i, i))
+    # zasah "a" ho posunie na koniec poradia, po ulozeni "c" sa zmaze "b"
+    assert cache.fetch("a", figure)
+    _draw(figure, 1000)
+    cache.store("c", figure)
+    assert sorted(os.listdir(tmp_path / "cache")) == ["a.png", "c.png"]
+    assert not cache.fetch("b", figure)
+    assert cache.stats() == {"hits": 1, "misses": 1, "evicted": 1, "hit_rate": 0.5}
+
+
+def test_figure_cache_evicts_expired(tmp_path):
+    cache = FigureCache(directory=str(tmp_path / "cache"), max_bytes=None, max_age=3600)
+    figure = str(tmp_path / "figure.png")
+    _draw(figure, 10)
+    cache.store("old", figure)
+    os.utime(cache.path("old", figure), (time.time() - 7200,) * 2)
+    cache.store("new", figure)
+    assert os.listdir(tmp_path / "cache") == ["new.png"]
+
+
+def test_figure_cache_key_depends_on_helpers():
+    cache = FigureCache()
+
+    def plot(counts):
+        return counts
+
+    def helper_v1(x):
+        return x
+
+    def helper_v2(x):
+        return x + 1
+
+    counts = np.arange(6).reshape(2, 3)
+    base = cache.key(plot, [counts], {"format": ".png"}, [helper_v1, "1.0"])
+    assert base == cache.key(plot, [counts.copy()], {"format": ".png"}, [helper_v1, "1.0"])
+    assert base != cache.key(plot, [counts], {"format": ".png"}, [helper_v2, "1.0"])
+    assert base != cache.key(plot, [counts], {"format": ".png"}, [helper_v1, "1.1"])
+    assert base != cache.key(plot, [counts + 1], {"format": ".png"}, [helper_v1, "1.0"])
+    assert base != cache.key(plot, [counts], {"format": ".svg"}, [helper_v1, "1.0"])